@@ -0,0 +1,83 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from database import Database
+
+class AsyncDatabase:
+    """Асинхронный фасад над Database: методы возвращают awaitable"""
+    
+    # Число потоков чтения и предел одновременно ожидающих чтений
+    READ_WORKERS = 4
+    MAX_PENDING_READS = 64
+    
+    # Методы чтения выполняются параллельно, каждый поток со своим соединением
+    READ_METHODS = frozenset({
+        'get_all_partners', 'get_all_products', 'get_all_employees', 'get_all_orders',
+        'get_product_by_name', 'get_partner_by_name', 'search_partners',
+        'count_partner_matches',
+        'get_orders_by_status', 'get_partners_page', 'get_products_page', 'get_orders_page',
+        'get_page', 'count_rows', 'get_page_at',
+        'get_order', 'get_order_items', 'get_product_demand',
+        'get_partner_sales_statistics', 'get_partner_sales_report', 'calculate_partner_discount',
+        'get_partner_discounts',
+        'get_top_products',
+    })
+    
+    # Методы записи и импорта выполняются по очереди в одном потоке записи,
+    # чтобы транзакции процесса не ждали друг друга на блокировке базы
+    WRITE_METHODS = frozenset({
+        'import_partners', 'import_material_types', 'import_product_types',
+        'import_products', 'import_sales_history', 'import_files',
+        'create_order', 'update_order_status', 'add_partner', 'update_partner_rating',
+        'sweep_expired_orders', 'check_expired_orders',
+        # Сбрасывает кэши выборок, поэтому не выполняется параллельно с чтениями
+        'check_query_plans',
+    })
+    
+    def __init__(self, db_name="master_pol.db", read_workers=None, database=None):
+        self.db = database or Database(db_name)
+        self.read_executor = ThreadPoolExecutor(
+            max_workers=read_workers or self.READ_WORKERS, thread_name_prefix='db-read'
+        )
+        self.write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write')
+        self.read_slots = None
+    
+    def __getattr__(self, name):
+        """Асинхронная версия метода Database с тем же именем"""
+        if name not in self.READ_METHODS and name not in self.WRITE_METHODS:
+            raise AttributeError(f"AsyncDatabase не поддерживает метод '{name}'")
+        
+        @functools.wraps(getattr(Database, name))
+        async def method(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+        return method
+    
+    async def call(self, method_name, *args, **kwargs):
+        """Выполнение метода Database в пуле чтения или в потоке записи"""
+        loop = asyncio.get_running_loop()
+        func = functools.partial(getattr(self.db, method_name), *args, **kwargs)
+        if method_name in self.WRITE_METHODS:
+            return await loop.run_in_executor(self.write_executor, func)
+        
+        # Ограничение очереди: лишние чтения ждут здесь, а не копятся в пуле потоков
+        if self.read_slots is None:
+            self.read_slots = asyncio.Semaphore(self.MAX_PENDING_READS)
+        async with self.read_slots:
+            return await loop.run_in_executor(self.read_executor, func)
+    
+    async def close(self):
+        """Завершение начатых операций и закрытие соединений"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.shutdown)
+    
+    def shutdown(self):
+        """Синхронное завершение пулов потоков и закрытие базы"""
+        self.write_executor.shutdown(wait=True)
+        self.read_executor.shutdown(wait=True)
+        self.db.close()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
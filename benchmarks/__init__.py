@@ -0,0 +1 @@
+"""Замеры производительности Database на синтетических данных: python -m benchmarks.run"""
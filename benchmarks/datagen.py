@@ -0,0 +1,155 @@
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from database import IMPORT_SPECS, import_order
+
+# Предел строк листа Excel: большие наборы загружаются только напрямую в SQLite
+EXCEL_MAX_ROWS = 1048575
+
+PARTNER_TYPES = ('ЗАО', 'ООО', 'ПАО', 'ОАО')
+PRODUCT_TYPES = (('Ламинат', 2.35), ('Массивная доска', 5.15), ('Паркетная доска', 4.34),
+                 ('Пробковое покрытие', 1.5))
+MATERIAL_TYPES = (('Тип материала 1', 0.001), ('Тип материала 2', 0.0095), ('Тип материала 3', 0.0028),
+                  ('Тип материала 4', 0.0055), ('Тип материала 5', 0.0034))
+ORDER_STATUSES = ('created', 'prepayment_received', 'in_production', 'ready', 'completed', 'cancelled')
+ORDER_STATUS_WEIGHTS = (0.15, 0.1, 0.1, 0.05, 0.5, 0.1)
+COMPANY_WORDS = ('Строй', 'Паркет', 'Ремонт', 'Отделка', 'Дом', 'Мастер', 'Пол', 'Сервис', 'Комфорт', 'Декор')
+SURNAMES = ('Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев')
+
+
+def dataset_sizes(sales_rows):
+    """Число строк каждого справочника для заданного объема истории продаж"""
+    return {
+        'material_types': len(MATERIAL_TYPES),
+        'product_types': len(PRODUCT_TYPES),
+        'products': int(min(20000, max(10, sales_rows // 500))),
+        'partners': int(max(10, sales_rows // 200)),
+        'sales_history': int(sales_rows),
+        'orders': int(max(10, sales_rows // 50)),
+    }
+
+
+def generate_dataset(sales_rows, seed=0):
+    """Синтетические данные импорта: тип -> DataFrame с заголовками файлов Excel
+    
+    Продажи распределены по партнерам и продуктам по закону Ципфа (несколько крупных
+    покупателей и ходовых позиций), количество - логнормально, даты - за три года.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = dataset_sizes(sales_rows)
+    
+    def frame(kind, columns):
+        headers = {column: header for header, (column, _) in IMPORT_SPECS[kind]['columns'].items()}
+        return pd.DataFrame({headers[column]: values for column, values in columns.items()})
+    
+    product_count = sizes['products']
+    product_types = rng.choice([name for name, _ in PRODUCT_TYPES], product_count)
+    product_names = np.array([f"{word} {kind.lower()} {i + 1}" for i, (word, kind) in
+                              enumerate(zip(rng.choice(COMPANY_WORDS, product_count), product_types))])
+    
+    partner_count = sizes['partners']
+    company_names = np.array([f"{a}{b.lower()} {i + 1}" for i, (a, b) in enumerate(zip(
+        rng.choice(COMPANY_WORDS, partner_count), rng.choice(COMPANY_WORDS, partner_count)))])
+    
+    sales_count = sizes['sales_history']
+    start = pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=3 * 365)
+    sale_dates = start + pd.to_timedelta(rng.integers(0, 3 * 365, sales_count), unit='D')
+    
+    return {
+        'material_types': frame('material_types', {
+            'material_type': [name for name, _ in MATERIAL_TYPES],
+            'defect_percentage': [value for _, value in MATERIAL_TYPES],
+        }),
+        'product_types': frame('product_types', {
+            'product_type': [name for name, _ in PRODUCT_TYPES],
+            'type_coefficient': [value for _, value in PRODUCT_TYPES],
+        }),
+        'products': frame('products', {
+            'product_type': product_types,
+            'name': product_names,
+            'article': [str(8000000 + i) for i in range(product_count)],
+            'min_partner_price': np.round(rng.lognormal(8, 0.6, product_count), 2),
+        }),
+        'partners': frame('partners', {
+            'partner_type': rng.choice(PARTNER_TYPES, partner_count),
+            'company_name': company_names,
+            'director_name': [f"{name} {i + 1}" for i, name in enumerate(rng.choice(SURNAMES, partner_count))],
+            'email': [f"partner{i + 1}@example.ru" for i in range(partner_count)],
+            'phone': [f"9{i:09d}" for i in range(partner_count)],
+            'legal_address': [f"г. Москва, ул. Лесная, {i + 1}" for i in range(partner_count)],
+            'inn': [str(1000000000 + i) for i in range(partner_count)],
+            'rating': rng.integers(1, 11, partner_count),
+        }),
+        'sales_history': frame('sales_history', {
+            'product_name': product_names[zipf_indices(rng, product_count, sales_count)],
+            'company_name': company_names[zipf_indices(rng, partner_count, sales_count)],
+            'quantity': np.maximum(1, rng.lognormal(6, 1.2, sales_count).astype('int64')),
+            'sale_date': sale_dates.strftime('%Y-%m-%d'),
+        }),
+    }
+
+
+def zipf_indices(rng, population, count, exponent=1.1):
+    """Индексы 0..population-1 с убывающей по закону Ципфа частотой"""
+    weights = 1.0 / np.arange(1, population + 1) ** exponent
+    return rng.choice(population, count, p=weights / weights.sum())
+
+
+def write_excel(dataset, directory):
+    """Запись набора в файлы Excel импорта; возвращает тип -> путь"""
+    paths = {}
+    for kind, df in dataset.items():
+        if len(df) > EXCEL_MAX_ROWS:
+            raise ValueError(f"{kind}: {len(df)} строк не помещаются на лист Excel")
+        paths[kind] = os.path.join(directory, IMPORT_SPECS[kind]['file'])
+        df.to_excel(paths[kind], index=False)
+    return paths
+
+
+def load_dataset(db, dataset):
+    """Загрузка набора напрямую в базу, минуя Excel"""
+    with db.transaction():
+        for kind in import_order(dataset):
+            if kind == 'sales_history':
+                db.load_sales_history(dataset[kind])
+            else:
+                db.bulk_load(dataset[kind], kind)
+
+
+def generate_orders(db, count, seed=0):
+    """Заявки с позициями для существующих партнеров и продукции"""
+    rng = np.random.default_rng(seed)
+    conn = db.get_connection()
+    partner_ids = np.array([row[0] for row in conn.execute('SELECT id FROM partners')])
+    products = conn.execute('SELECT id, min_partner_price FROM products').fetchall()
+    manager_ids = np.array([row[0] for row in conn.execute('SELECT id FROM employees')])
+    
+    order_dates = pd.Timestamp(datetime.now()) - pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, count), unit='s')
+    item_counts = rng.integers(1, 6, count)
+    item_product = rng.integers(0, len(products), item_counts.sum())
+    item_quantity = rng.integers(1, 200, item_counts.sum())
+    item_price = np.array([products[i][1] for i in item_product])
+    item_total = np.round(item_price * item_quantity, 2)
+    order_index = np.repeat(np.arange(count), item_counts)
+    order_totals = np.bincount(order_index, weights=item_total, minlength=count)
+    
+    with db.transaction() as cursor:
+        first_id = (cursor.execute('SELECT COALESCE(MAX(id), 0) FROM orders').fetchone()[0]) + 1
+        db.insert_columns('orders', {
+            'id': list(range(first_id, first_id + count)),
+            'partner_id': rng.choice(partner_ids, count).tolist(),
+            'manager_id': rng.choice(manager_ids, count).tolist(),
+            'order_date': order_dates.strftime('%Y-%m-%d %H:%M:%S').tolist(),
+            'status': rng.choice(ORDER_STATUSES, count, p=ORDER_STATUS_WEIGHTS).tolist(),
+            'products_list': ['[]'] * count,
+            'total_cost': np.round(order_totals, 2).tolist(),
+        })
+        db.insert_columns('order_items', {
+            'order_id': (order_index + first_id).tolist(),
+            'product_id': [products[i][0] for i in item_product],
+            'quantity': item_quantity.tolist(),
+            'price': item_price.tolist(),
+            'total': item_total.tolist(),
+        })
+    return list(range(first_id, first_id + count))
@@ -0,0 +1,233 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from database import Database
+from benchmarks.datagen import (EXCEL_MAX_ROWS, dataset_sizes, generate_dataset, generate_orders,
+                                load_dataset, write_excel)
+
+DEFAULT_SCALES = (10000, 100000, 1000000)
+
+# Замеряемые методы Database: (название замера, метод, функция аргументов от контекста)
+METHOD_BENCHMARKS = (
+    ('get_all_partners', 'get_all_partners', lambda ctx: ()),
+    ('get_all_products', 'get_all_products', lambda ctx: ()),
+    ('get_all_employees', 'get_all_employees', lambda ctx: ()),
+    ('get_all_orders', 'get_all_orders', lambda ctx: ()),
+    ('get_orders_by_status', 'get_orders_by_status', lambda ctx: ('created',)),
+    ('get_partner_by_name', 'get_partner_by_name', lambda ctx: (ctx['partner_name'],)),
+    ('get_product_by_name', 'get_product_by_name', lambda ctx: (ctx['product_name'],)),
+    ('search_partners', 'search_partners', lambda ctx: (ctx['partner_name'][:4],)),
+    ('get_partners_page', 'get_partners_page', lambda ctx: ()),
+    ('get_products_page', 'get_products_page', lambda ctx: ()),
+    ('get_orders_page', 'get_orders_page', lambda ctx: ()),
+    ('count_rows:orders', 'count_rows', lambda ctx: ('orders',)),
+    ('get_page_at:partners_middle', 'get_page_at', lambda ctx: ('partners', ctx['partner_count'] // 2)),
+    ('get_order', 'get_order', lambda ctx: (ctx['order_id'],)),
+    ('get_order_items', 'get_order_items', lambda ctx: (ctx['order_id'],)),
+    ('get_product_demand', 'get_product_demand', lambda ctx: ()),
+    ('get_partner_sales_statistics', 'get_partner_sales_statistics', lambda ctx: (ctx['partner_id'],)),
+    ('calculate_partner_discount', 'calculate_partner_discount', lambda ctx: (ctx['partner_id'],)),
+    ('get_partner_discounts', 'get_partner_discounts', lambda ctx: ()),
+    ('get_top_products', 'get_top_products', lambda ctx: ()),
+    ('update_order_status', 'update_order_status', lambda ctx: (ctx['order_id'], 'in_production')),
+    ('create_order', 'create_order', lambda ctx: (ctx['partner_id'], ctx['manager_id'], ctx['order_items'],
+                                                  ctx['order_items'][0]['total'])),
+    ('sweep_expired_orders', 'sweep_expired_orders', lambda ctx: ()),
+)
+
+# Методы с кэшем в Database: кроме замеров без кэша, отдельно замеряются повторы из кэша
+CACHED_BENCHMARKS = frozenset({'get_all_partners', 'get_all_products', 'get_all_employees', 'get_order'})
+
+# Импорт каждого файла отдельным методом
+IMPORT_BENCHMARKS = (
+    ('material_types', 'import_material_types'),
+    ('product_types', 'import_product_types'),
+    ('products', 'import_products'),
+    ('partners', 'import_partners'),
+    ('sales_history', 'import_sales_history'),
+)
+
+
+def measure(func, repeat, setup=None):
+    """Время вызовов func в мс: первый вызов отдельно, остальные - медиана
+    
+    setup() вызывается перед каждым повтором вне замера (например, сброс кэша).
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    warm = timings[1:] or timings
+    return {
+        'runs': len(timings),
+        'first_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(warm), 3),
+        'min_ms': round(min(warm), 3),
+        'max_ms': round(max(warm), 3),
+    }
+
+
+def fresh_database(path):
+    """Database в пустом файле: базы прежнего запуска в том же каталоге удаляются"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return Database(path)
+
+
+def benchmark_context(db):
+    """Аргументы замеров: существующие партнер, продукт, заявка и менеджер"""
+    conn = db.get_connection()
+    partner_id, partner_name = conn.execute('SELECT id, company_name FROM partners ORDER BY id LIMIT 1').fetchone()
+    product_id, product_name, price = conn.execute(
+        'SELECT id, name, min_partner_price FROM products ORDER BY id LIMIT 1'
+    ).fetchone()
+    return {
+        'partner_id': partner_id,
+        'partner_name': partner_name,
+        'partner_count': conn.execute('SELECT COUNT(*) FROM partners').fetchone()[0],
+        'product_name': product_name,
+        'order_id': conn.execute('SELECT MAX(id) FROM orders').fetchone()[0],
+        'manager_id': conn.execute('SELECT MIN(id) FROM employees').fetchone()[0],
+        'order_items': [{'product_id': product_id, 'quantity': 10, 'price': price, 'total': price * 10}],
+    }
+
+
+def run_scale(scale, directory, repeat, excel_max_rows, seed):
+    """Замеры для одного объема истории продаж: список результатов"""
+    results = []
+    
+    def add(name, timing, **extra):
+        results.append(dict({'scale': scale, 'benchmark': name}, **timing, **extra))
+        logging.info(f"[{scale}] {name}: {timing.get('median_ms', timing.get('first_ms'))} мс")
+    
+    started = time.perf_counter()
+    dataset = generate_dataset(scale, seed)
+    add('generate_dataset', {'runs': 1, 'first_ms': round((time.perf_counter() - started) * 1000, 3)})
+    
+    db = fresh_database(os.path.join(directory, f'bench_{scale}.db'))
+    try:
+        add('load_dataset', measure(lambda: load_dataset(db, dataset), 1),
+            rows=sum(len(df) for df in dataset.values()))
+        generate_orders(db, dataset_sizes(scale)['orders'], seed)
+        context = benchmark_context(db)
+        for name, method_name, make_args in METHOD_BENCHMARKS:
+            args = make_args(context)
+            call = lambda: getattr(db, method_name)(*args)
+            # Каждый повтор выполняет запросы: кэши Database сбрасываются перед ним
+            add(name, measure(call, repeat, setup=db.clear_cache))
+            if name in CACHED_BENCHMARKS:
+                add(f'{name}:cached', measure(call, repeat))
+    finally:
+        db.close()
+    
+    if scale > excel_max_rows:
+        return results
+    
+    # Импорт из Excel в пустую базу: по одному файлу и всех файлов сразу
+    paths = write_excel(dataset, directory)
+    db = fresh_database(os.path.join(directory, f'bench_{scale}_excel.db'))
+    try:
+        for kind, method_name in IMPORT_BENCHMARKS:
+            add(method_name, measure(lambda: getattr(db, method_name)(paths[kind]), 1),
+                rows=len(dataset[kind]))
+    finally:
+        db.close()
+    
+    db = fresh_database(os.path.join(directory, f'bench_{scale}_files.db'))
+    try:
+        add('import_files', measure(lambda: db.import_files(paths), 1),
+            rows=sum(len(df) for df in dataset.values()))
+    finally:
+        db.close()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Сравнение медиан с сохраненными результатами: (замер, было, стало, отношение)"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(item['scale'], item['benchmark']): item for item in baseline['results']}
+    rows = []
+    for item in results:
+        old = previous.get((item['scale'], item['benchmark']))
+        if old is None:
+            continue
+        key = 'median_ms' if 'median_ms' in item and 'median_ms' in old else 'first_ms'
+        ratio = item[key] / old[key] if old[key] else float('inf')
+        rows.append((f"{item['scale']} {item['benchmark']}", old[key], item[key], ratio))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности Database на синтетических данных")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help="объемы истории продаж (строк)")
+    parser.add_argument('--repeat', type=int, default=5, help="повторов каждого замера методов")
+    parser.add_argument('--excel-max-rows', type=int, default=200000,
+                        help="наибольший объем, для которого замеряется импорт из Excel")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="файл JSON для результатов")
+    parser.add_argument('--compare', help="файл JSON с результатами для сравнения")
+    parser.add_argument('--workdir', help="каталог для баз и файлов Excel (по умолчанию временный)")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Сообщения Database о каждой операции заглушили бы результаты
+    logging.getLogger('database').setLevel(logging.WARNING)
+    
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.workdir or tmp
+        os.makedirs(directory, exist_ok=True)
+        for scale in args.scales:
+            results.extend(run_scale(scale, directory, args.repeat,
+                                     min(args.excel_max_rows, EXCEL_MAX_ROWS), args.seed))
+    
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    
+    if args.compare:
+        for name, old, new, ratio in compare(results, args.compare):
+            print(f"{name:60} {old:12.3f} -> {new:12.3f} мс  x{ratio:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from database import Database, IMPORT_SPECS
+from query_stats import add_stats_arguments, start_stats
+
+# Коды завершения
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+# Выгружаемые данные: название -> запрос
+EXPORT_QUERIES = {
+    'partners': 'SELECT * FROM partners ORDER BY id',
+    'products': 'SELECT * FROM products ORDER BY id',
+    'orders': '''
+        SELECT o.*, p.company_name, e.full_name AS manager_name
+        FROM orders o
+        LEFT JOIN partners p ON o.partner_id = p.id
+        LEFT JOIN employees e ON o.manager_id = e.id
+        ORDER BY o.id
+    ''',
+    'order_items': 'SELECT * FROM order_items ORDER BY id',
+    'sales_history': '''
+        SELECT s.id, p.company_name, pr.name AS product_name, s.quantity, s.sale_date, s.total_amount
+        FROM sales_history s
+        JOIN partners p ON p.id = s.partner_id
+        JOIN products pr ON pr.id = s.product_id
+        ORDER BY s.id
+    ''',
+    'partner_sales_summary': '''
+        SELECT p.company_name, s.*
+        FROM partner_sales_summary s
+        JOIN partners p ON p.id = s.partner_id
+        ORDER BY p.company_name
+    ''',
+}
+
+
+def print_json(data):
+    json.dump(data, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+def command_import(db, args):
+    """Импорт одного или всех файлов Excel"""
+    directory = args.dir or '.'
+    if args.kind == 'all':
+        if args.file:
+            print("--file задается только для импорта одного типа данных", file=sys.stderr)
+            return EXIT_USAGE
+        sources = {kind: os.path.join(directory, spec['file']) for kind, spec in IMPORT_SPECS.items()}
+        results = db.import_files(sources)
+        if not results:
+            return EXIT_FAILED
+        for kind, rows, error in results:
+            status = f"ошибка: {error}" if error is not None else f"{rows} строк"
+            print(f"{IMPORT_SPECS[kind]['description']}: {status}")
+        return EXIT_OK if all(error is None for _, _, error in results) else EXIT_FAILED
+    
+    file_path = args.file or os.path.join(directory, IMPORT_SPECS[args.kind]['file'])
+    if args.kind == 'sales_history':
+        success = db.import_sales_history(file_path, reject_report_path=args.rejects)
+    else:
+        success = db.import_excel(file_path, args.kind)
+    print(f"{IMPORT_SPECS[args.kind]['description']}: {'загружено' if success else 'ошибка импорта'}")
+    return EXIT_OK if success else EXIT_FAILED
+
+
+def command_sweep(db, args):
+    """Отмена заявок с истекшим сроком предоплаты"""
+    expired_ids = db.sweep_expired_orders()
+    if expired_ids is None:
+        print("Ошибка проверки просроченных заявок", file=sys.stderr)
+        return EXIT_FAILED
+    if args.json:
+        print_json({'cancelled': expired_ids})
+    else:
+        print(f"Отменено заявок: {len(expired_ids)}")
+        if expired_ids:
+            print(', '.join(map(str, expired_ids)))
+    return EXIT_OK
+
+
+def command_partner_stats(db, args):
+    """Статистика продаж и скидки партнеров"""
+    if args.partner is not None and args.id is not None:
+        print("Партнер задается либо названием, либо --id", file=sys.stderr)
+        return EXIT_USAGE
+    if args.id is not None:
+        report = db.get_partner_sales_report(partner_ids=[args.id])
+    else:
+        report = db.get_partner_sales_report(company_name=args.partner)
+    if report is None:
+        print("Ошибка получения статистики партнеров", file=sys.stderr)
+        return EXIT_FAILED
+    if not report and (args.partner is not None or args.id is not None):
+        print(f"Партнер не найден: {args.partner if args.id is None else args.id}", file=sys.stderr)
+        return EXIT_FAILED
+    
+    if args.json:
+        print_json(report)
+        return EXIT_OK
+    for item in report:
+        print(f"{item['partner_id']:>6}  {item['company_name'][:40]:40}  {item['total_quantity']:>10}  "
+              f"{item.get('total_amount', 0):>15,.2f}  {item.get('discount', 0):.0%}")
+    return EXIT_OK
+
+
+def command_top_products(db, args):
+    """Топ продукции по продажам"""
+    products = db.get_top_products(args.limit)
+    if products is None:
+        print("Ошибка получения топа продукции", file=sys.stderr)
+        return EXIT_FAILED
+    if args.json:
+        print_json([
+            {'name': name, 'product_type': product_type, 'total_sold': sold, 'total_revenue': revenue}
+            for name, product_type, sold, revenue in products
+        ])
+        return EXIT_OK
+    for name, product_type, sold, revenue in products:
+        print(f"{name[:40]:40}  {product_type[:20]:20}  {sold:>10}  {revenue or 0:>15,.2f}")
+    return EXIT_OK
+
+
+def command_export(db, args):
+    """Выгрузка таблицы в CSV блоками, без загрузки всей таблицы в память"""
+    import pandas as pd
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8-sig', newline='')
+    try:
+        chunks = pd.read_sql_query(EXPORT_QUERIES[args.table], db.get_connection(),
+                                   chunksize=Database.IMPORT_CHUNK_SIZE)
+        rows = 0
+        for chunk in chunks:
+            chunk.to_csv(output, index=False, header=rows == 0)
+            rows += len(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if output is not sys.stdout:
+        print(f"Выгружено строк: {rows} -> {args.output}", file=sys.stderr)
+    return EXIT_OK
+
+
+def command_check_plans(db, args):
+    """Проверка планов запросов: ненулевой код при полных сканированиях"""
+    problems = db.check_query_plans()
+    if args.json:
+        print_json([{'method': method_name, 'plan': detail} for method_name, detail in problems])
+    else:
+        for method_name, detail in problems:
+            print(f"{method_name}: {detail}")
+    return EXIT_FAILED if problems else EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Мастер пол: импорт, обслуживание и отчеты без интерфейса")
+    parser.add_argument('--db', default="master_pol.db", help="файл базы данных")
+    parser.add_argument('-q', '--quiet', action='store_true', help="только предупреждения и ошибки в журнале")
+    add_stats_arguments(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    import_parser = commands.add_parser('import', help="импорт файлов Excel")
+    import_parser.add_argument('kind', choices=list(IMPORT_SPECS) + ['all'])
+    import_parser.add_argument('--file', help="файл Excel (по умолчанию стандартное имя)")
+    import_parser.add_argument('--dir', help="каталог с файлами импорта")
+    import_parser.add_argument('--rejects', help="CSV для отклоненных строк истории продаж")
+    import_parser.set_defaults(handler=command_import)
+    
+    sweep_parser = commands.add_parser('sweep', help="отмена заявок с истекшим сроком предоплаты")
+    sweep_parser.add_argument('--json', action='store_true')
+    sweep_parser.set_defaults(handler=command_sweep)
+    
+    stats_parser = commands.add_parser('partner-stats', help="статистика продаж и скидки партнеров")
+    stats_parser.add_argument('partner', nargs='?', help="название партнера (по умолчанию все)")
+    stats_parser.add_argument('--id', type=int, help="id партнера вместо названия")
+    stats_parser.add_argument('--json', action='store_true')
+    stats_parser.set_defaults(handler=command_partner_stats)
+    
+    top_parser = commands.add_parser('top-products', help="топ продукции по продажам")
+    top_parser.add_argument('--limit', type=int, default=10)
+    top_parser.add_argument('--json', action='store_true')
+    top_parser.set_defaults(handler=command_top_products)
+    
+    export_parser = commands.add_parser('export', help="выгрузка данных в CSV")
+    export_parser.add_argument('table', choices=list(EXPORT_QUERIES))
+    export_parser.add_argument('-o', '--output', default='-', help="файл CSV ('-' - стандартный вывод)")
+    export_parser.set_defaults(handler=command_export)
+    
+    plans_parser = commands.add_parser('check-plans', help="проверка планов запросов на полные сканирования")
+    plans_parser.add_argument('--json', action='store_true')
+    plans_parser.set_defaults(handler=command_check_plans)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Журнал идет в stderr, чтобы не смешиваться с отчетами в stdout
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+    if args.quiet:
+        logging.getLogger('database').setLevel(logging.WARNING)
+    
+    stats = start_stats(args)
+    db = Database(args.db, stats=stats)
+    try:
+        return args.handler(db, args)
+    except OSError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    finally:
+        db.close()
+        if stats is not None:
+            stats.stop_dump()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
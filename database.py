@@ -1,14 +1,413 @@
 import sqlite3
-import pandas as pd
 from datetime import datetime, timedelta
+import functools
+import itertools
 import json
 import logging
+import multiprocessing
 import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from contextlib import contextmanager
+from query_stats import InstrumentedConnection
+
+# Описание импортируемых файлов:
+# таблица, файл по умолчанию, ключ для UPSERT, описание для лога и
+# соответствие заголовка Excel -> (столбец таблицы, тип значения)
+IMPORT_SPECS = {
+    'material_types': {
+        'table': 'material_types',
+        'file': 'Material_type_import.xlsx',
+        'key': 'material_type',
+        'description': 'типов материалов',
+        'columns': {
+            'Тип материала': ('material_type', 'text'),
+            'Процент брака материала': ('defect_percentage', 'real'),
+        },
+    },
+    'product_types': {
+        'table': 'product_types',
+        'file': 'Product_type_import.xlsx',
+        'key': 'product_type',
+        'description': 'типов продукции',
+        'columns': {
+            'Тип продукции': ('product_type', 'text'),
+            'Коэффициент типа продукции': ('type_coefficient', 'real'),
+        },
+    },
+    'products': {
+        'table': 'products',
+        'file': 'Products_import.xlsx',
+        'key': 'article',
+        'description': 'продуктов',
+        'columns': {
+            'Тип продукции': ('product_type', 'text'),
+            'Наименование продукции': ('name', 'text'),
+            'Артикул': ('article', 'text'),
+            'Минимальная стоимость для партнера': ('min_partner_price', 'real'),
+        },
+    },
+    'partners': {
+        'table': 'partners',
+        'file': 'Partners_import.xlsx',
+        'key': 'inn',
+        'description': 'партнеров',
+        'columns': {
+            'Тип партнера': ('partner_type', 'text'),
+            'Наименование партнера': ('company_name', 'text'),
+            'Директор': ('director_name', 'text'),
+            'Электронная почта партнера': ('email', 'text'),
+            'Телефон партнера': ('phone', 'text'),
+            'Юридический адрес партнера': ('legal_address', 'text'),
+            'ИНН': ('inn', 'text'),
+            'Рейтинг': ('rating', 'int'),
+        },
+    },
+    # Названия партнера и продукта сопоставляются с id в load_sales_history
+    'sales_history': {
+        'table': 'sales_history',
+        'file': 'Partner_products_import.xlsx',
+        'key': None,
+        'description': 'записей истории продаж',
+        'columns': {
+            'Продукция': ('product_name', 'text'),
+            'Наименование партнера': ('company_name', 'text'),
+            'Количество продукции': ('quantity', 'int'),
+            'Дата продажи': ('sale_date', 'date'),
+        },
+    },
+}
+
+# Данные, которые должны быть загружены раньше: тип импорта -> зависимости
+IMPORT_DEPENDENCIES = {
+    'products': ('product_types',),
+    'sales_history': ('products', 'partners'),
+}
+
+# Уровни скидок партнера: (объем продаж, который нужно превысить, скидка)
+DISCOUNT_TIERS = (
+    (0, 0.02),
+    (1000000, 0.05),
+    (5000000, 0.10),
+    (10000000, 0.15),
+)
+
+
+def calculate_discounts(total_amounts):
+    """Векторный расчет скидок: (скидка, следующая скидка, порог следующей скидки)"""
+    # numpy загружается при первом расчете, а не при запуске приложения
+    import numpy as np
+    thresholds = np.array([threshold for threshold, _ in DISCOUNT_TIERS], dtype='float64')
+    rates = np.array([rate for _, rate in DISCOUNT_TIERS] + [np.nan])
+    amounts = np.nan_to_num(np.asarray(total_amounts, dtype='float64'))
+    # Номер уровня = количество порогов (кроме базового), которые объем строго превышает
+    levels = np.searchsorted(thresholds[1:], amounts, side='left')
+    next_thresholds = np.append(thresholds[1:], np.nan)[levels]
+    return rates[levels], rates[levels + 1], next_thresholds
+
+
+def coerce_column(series, kind):
+    """Приведение столбца DataFrame к типу SQLite; пропуски становятся None"""
+    # pandas и openpyxl импортируются при первом импорте данных: запуск без них быстрее
+    import pandas as pd
+    if kind == 'text':
+        # Числа из Excel (ИНН, артикул) приходят как int/float: 2222455179.0 -> '2222455179'
+        if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+            series = series.astype('Int64')
+        series = series.astype('string').str.strip()
+    elif kind == 'int':
+        series = pd.to_numeric(series, errors='coerce').round().astype('Int64')
+    elif kind == 'real':
+        series = pd.to_numeric(series, errors='coerce').astype('float64')
+    elif kind == 'date':
+        series = pd.to_datetime(series, errors='coerce').dt.strftime('%Y-%m-%d')
+    else:
+        raise ValueError(f"Неизвестный тип столбца: {kind}")
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def prepare_import_columns(df, column_map):
+    """Сопоставление заголовков Excel столбцам таблицы с приведением типов"""
+    # В выгрузках встречаются заголовки с пробелами по краям
+    df = df.rename(columns=lambda name: str(name).strip())
+    missing = [header for header in column_map if header not in df.columns]
+    if missing:
+        raise KeyError(f"В файле нет столбцов: {', '.join(missing)}")
+    return {
+        column: coerce_column(df[header], kind)
+        for header, (column, kind) in column_map.items()
+    }
+
+
+def read_excel_chunks(file_path, chunk_size):
+    """Потоковое чтение первого листа Excel блоками DataFrame по chunk_size строк"""
+    import pandas as pd
+    from openpyxl import load_workbook
+    # read_only: строки разбираются по мере обхода, файл целиком в память не загружается
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = ['' if name is None else str(name) for name in header]
+        width = len(header)
+        
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            # В read_only режиме строки могут быть короче заголовка
+            chunk.append(tuple(row[:width]) + (None,) * (width - len(row)))
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+class ImportCancelled(Exception):
+    """Импорт прерван по запросу пользователя"""
+
+
+def track_chunks(chunks, cancel_event=None, progress=None):
+    """Блоки импорта с проверкой отмены и отчетом о числе прочитанных строк"""
+    rows = 0
+    for chunk in chunks:
+        # Исключение внутри транзакции загрузки откатывает уже вставленные блоки
+        if cancel_event is not None and cancel_event.is_set():
+            raise ImportCancelled()
+        rows += len(chunk)
+        if progress is not None:
+            progress(rows)
+        yield chunk
+    if cancel_event is not None and cancel_event.is_set():
+        raise ImportCancelled()
+
+
+def prefetch_first(chunks):
+    """Чтение первого блока заранее: транзакция загрузки открывается, когда данные уже есть"""
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    return chunks if first is None else itertools.chain((first,), chunks)
+
+
+def spool_excel_chunks(file_path, chunk_size, directory):
+    """Чтение файла Excel блоками в файлы pickle каталога directory (выполняется в процессе-обработчике)
+    
+    В памяти процесса одновременно только один блок; возвращает пути файлов блоков по порядку.
+    """
+    paths = []
+    for number, chunk in enumerate(read_excel_chunks(file_path, chunk_size)):
+        path = os.path.join(directory, f'{number:06d}.pkl')
+        chunk.to_pickle(path)
+        paths.append(path)
+    return paths
+
+
+def stop_workers(executor):
+    """Остановка ProcessPoolExecutor без ожидания начатых задач"""
+    # cancel_futures снимает только задачи из очереди; публичного способа прервать
+    # уже выполняющиеся нет, поэтому процессы завершаются напрямую
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def read_spooled_chunks(paths):
+    """Блоки, записанные spool_excel_chunks(); файл блока удаляется после чтения"""
+    import pandas as pd
+    for path in paths:
+        chunk = pd.read_pickle(path)
+        os.remove(path)
+        yield chunk
+
+
+def import_order(kinds):
+    """Порядок загрузки типов импорта: каждый после своих зависимостей из того же набора"""
+    ordered = []
+    
+    def visit(kind):
+        if kind in ordered:
+            return
+        for dependency in IMPORT_DEPENDENCIES.get(kind, ()):
+            if dependency in kinds:
+                visit(dependency)
+        ordered.append(kind)
+    
+    for kind in kinds:
+        visit(kind)
+    return ordered
+
 
 class Database:
-    def __init__(self, db_name="master_pol.db"):
+    # Ожидание снятия блокировки другим соединением, мс
+    BUSY_TIMEOUT_MS = 5000
+    
+    # Параметры, применяемые к каждому новому соединению
+    CONNECTION_PRAGMAS = (
+        ('journal_mode', 'WAL'),        # читатели не блокируют писателя
+        ('synchronous', 'NORMAL'),      # в режиме WAL безопасно и быстрее FULL
+        ('busy_timeout', BUSY_TIMEOUT_MS),
+        ('cache_size', -65536),         # 64 МБ страничного кэша
+        ('mmap_size', 268435456),       # 256 МБ отображения файла в память
+        ('temp_store', 'MEMORY'),
+    )
+    
+    # Размер блока строк при потоковом импорте Excel
+    IMPORT_CHUNK_SIZE = 50000
+    
+    # Файлы меньше этого размера import_files() читает сам: запуск процесса обошелся бы дороже
+    PARALLEL_IMPORT_MIN_BYTES = 1024 * 1024
+    
+    # Срок ожидания предоплаты и период фоновой проверки просроченных заявок (секунды)
+    PREPAYMENT_DAYS = 3
+    EXPIRY_SWEEP_INTERVAL = 300
+    
+    # Условие просроченной заявки: поиск по индексу (status, order_date)
+    EXPIRED_ORDERS_WHERE = '''
+        WHERE status = 'created'
+        AND prepayment_received = FALSE
+        AND order_date < ?
+    '''
+    # Отмена всех найденных заявок одним запросом; RETURNING есть в SQLite начиная с 3.35
+    EXPIRED_ORDERS_UPDATE_SQL = f"UPDATE orders SET status = 'cancelled', notes = ? {EXPIRED_ORDERS_WHERE}"
+    EXPIRED_ORDERS_SQL = f'{EXPIRED_ORDERS_UPDATE_SQL} RETURNING id'
+    # В более старых версиях id выбираются отдельным запросом в той же транзакции
+    EXPIRED_ORDERS_SELECT_SQL = f'SELECT id FROM orders {EXPIRED_ORDERS_WHERE}'
+    SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35)
+    
+    # Есть ли другие продажи той же пары партнер-продукт: построчная проверка в триггерах
+    # сводки продаж, поиск по индексу idx_sales_history_partner (partner_id, product_id)
+    SALES_PAIR_EXISTS_SQL = ('SELECT 1 FROM sales_history WHERE partner_id = {partner_id} '
+                             'AND product_id = {product_id} AND id <> {id}')
+    
+    # Число заявок в LRU-кэше get_order()
+    ORDER_CACHE_SIZE = 256
+    
+    # Упорядоченный список миграций схемы: (версия, описание, метод)
+    MIGRATIONS = (
+        (1, 'Начальная схема', 'migrate_initial_schema'),
+        (2, 'Индексы для частых запросов', 'migrate_indexes'),
+        (3, 'Сводка продаж по партнерам', 'migrate_partner_sales_summary'),
+        (4, 'Таблица позиций заявок', 'migrate_order_items'),
+        (5, 'Полнотекстовый поиск партнеров', 'migrate_partners_fts'),
+    )
+    
+    # Столбцы партнеров в полнотекстовом индексе и их веса в ранжировании bm25
+    PARTNER_SEARCH_COLUMNS = (
+        ('company_name', 10.0),
+        ('director_name', 5.0),
+        ('inn', 3.0),
+        ('email', 1.0),
+        ('phone', 1.0),
+    )
+    
+    # Методы чтения для check_query_plans(): (метод, тестовые аргументы, ожидаемый доступ)
+    # 'seek' - только поиск по индексу (найденные строки можно сортировать);
+    # 'ordered' - допустим обход индекса в порядке ORDER BY без сортировки во временном B-дереве; 'scan' - допустим полный обход индекса
+    QUERY_PLAN_CHECKS = (
+        ('get_all_partners', (), 'ordered'),
+        ('get_all_products', (), 'ordered'),
+        ('get_product_by_name', ('',), 'seek'),
+        ('get_partner_by_name', ('',), 'seek'),
+        ('get_all_orders', (), 'ordered'),
+        ('get_orders_by_status', ('created',), 'seek'),
+        ('get_partner_sales_statistics', (0,), 'seek'),
+        ('calculate_partner_discount', (0,), 'seek'),
+        ('get_partner_sales_report', (None, ''), 'seek'),
+        ('get_top_products', (), 'scan'),
+        ('get_order_items', (0,), 'seek'),
+        ('get_order', (0,), 'seek'),
+        ('get_product_demand', (), 'scan'),
+        ('get_partners_page', (('', 0),), 'seek'),
+        ('get_products_page', (('', 0),), 'seek'),
+        ('get_orders_page', (('9999', 0),), 'seek'),
+        ('get_orders_page', (('9999', 0), 100, 'created'), 'seek'),
+        ('search_partners', ('строй',), 'seek'),
+        ('count_partner_matches', ('строй',), 'seek'),
+        ('count_rows', ('partners',), 'scan'),
+        ('count_rows', ('orders', 'created'), 'seek'),
+        ('get_page_at', ('products', 1), 'ordered'),
+        ('get_page_at', ('orders', 1), 'ordered'),
+        ('get_page_at', ('orders', 1, 100, 'created'), 'seek'),
+    )
+    
+    # Запросы методов записи и триггеров: проверяются только через EXPLAIN, без выполнения
+    # (метод, запрос, тестовые параметры, ожидаемый доступ, обязательный поиск по индексу или None)
+    QUERY_PLAN_STATEMENTS = (
+        ('sweep_expired_orders', EXPIRED_ORDERS_SELECT_SQL, ('',), 'seek', None),
+        ('sweep_expired_orders', EXPIRED_ORDERS_UPDATE_SQL, ('', ''), 'seek', None),
+        # Триггеры сводки выполняют проверку на каждую загружаемую строку истории продаж
+        ('import_sales_history', SALES_PAIR_EXISTS_SQL.format(partner_id='?', product_id='?', id='?'),
+         (0, 0, 0), 'seek', 'idx_sales_history_partner (partner_id=? AND product_id=?)'),
+    )
+    
+    # Источники постраничной выборки: основная таблица, запрос, ключ сортировки
+    # (уникальный за счет id), позиции столбцов ключа в строке результата и направление
+    PAGE_SOURCES = {
+        'partners': {
+            'table': 'partners',
+            'select': 'SELECT * FROM partners',
+            'key': ('company_name', 'id'),
+            'key_positions': (2, 0),
+            'descending': False,
+        },
+        'products': {
+            'table': 'products',
+            'select': 'SELECT * FROM products',
+            'key': ('name', 'id'),
+            'key_positions': (2, 0),
+            'descending': False,
+        },
+        'orders': {
+            'table': 'orders o',
+            'select': '''
+                SELECT o.*, p.company_name, e.full_name as manager_name
+                FROM orders o
+                LEFT JOIN partners p ON o.partner_id = p.id
+                LEFT JOIN employees e ON o.manager_id = e.id
+            ''',
+            'key': ('o.order_date', 'o.id'),
+            'key_positions': (3, 0),
+            'descending': True,
+            'status_column': 'o.status',
+        },
+    }
+    
+    def __init__(self, db_name="master_pol.db", stats=None):
         self.db_name = db_name
+        # QueryStats: замер времени методов и запросов, если задан
+        self.stats = stats
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        # Число отклоненных строк последнего импорта истории продаж по причинам
+        self.last_import_rejects = None
+        self.expiry_thread = None
+        self.expiry_stop = None
+        # Остановленные без ожидания потоки проверки: дожидаются завершения только в close()
+        self.stopped_expiry_threads = []
+        self.order_cache = OrderedDict()
+        self.order_cache_lock = threading.Lock()
+        self.order_cache_stamp = None
+        # Кэш справочных выборок: ключ -> (отметка версии данных, строки)
+        self.query_cache = {}
+        self.cache_lock = threading.Lock()
+        self.write_version = 0
+        self.version_conn = None
         self.setup_logging()
+        if self.stats is not None:
+            self.stats.wrap_methods(self)
         self.init_database()
     
     def setup_logging(self):
@@ -18,399 +417,894 @@ class Database:
         )
         self.logger = logging.getLogger(__name__)
     
+    def log_error(self, message):
+        """Запись перехваченной ошибки в лог и в счетчик ошибок метода QueryStats"""
+        self.logger.error(message)
+        if self.stats is not None:
+            self.stats.record_error()
+    
     def get_connection(self):
-        return sqlite3.connect(self.db_name)
+        """Получение постоянного соединения текущего потока"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.open_connection()
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.append(conn)
+        return conn
+    
+    def open_connection(self):
+        """Открытие нового соединения с настройками производительности"""
+        # isolation_level=None: транзакции открываются явно в transaction()
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=self.BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            factory=InstrumentedConnection if self.stats is not None else sqlite3.Connection
+        )
+        if self.stats is not None:
+            conn.stats = self.stats
+        for name, value in self.CONNECTION_PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+    
+    @contextmanager
+    def transaction(self):
+        """Транзакция на соединении текущего потока: commit при успехе, rollback при ошибке"""
+        conn = self.get_connection()
+        if conn.in_transaction:
+            # Вложенный вызов выполняется в рамках внешней транзакции
+            yield conn.cursor()
+            return
+        
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn.cursor()
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+            # Любая запись этого процесса делает кэшированные выборки устаревшими
+            with self.cache_lock:
+                self.write_version += 1
+    
+    def release_connection(self):
+        """Закрытие соединения текущего потока перед его завершением"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            return
+        self.local.conn = None
+        with self.connections_lock:
+            if conn in self.connections:
+                self.connections.remove(conn)
+        conn.close()
+    
+    def close(self):
+        """Закрытие всех соединений пула"""
+        # Начатые проверки просроченных заявок завершаются до закрытия их соединений
+        self.stop_expiry_scheduler(timeout=None)
+        for thread in self.stopped_expiry_threads:
+            thread.join()
+        self.stopped_expiry_threads.clear()
+        with self.connections_lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+        self.local = threading.local()
+        with self.cache_lock:
+            if self.version_conn is not None:
+                self.version_conn.close()
+                self.version_conn = None
+    
+    def get_data_stamp(self):
+        """Отметка версии данных: (счетчик записей процесса, PRAGMA data_version)"""
+        with self.cache_lock:
+            # data_version меняется при фиксации изменений любым другим соединением,
+            # поэтому отдельное соединение замечает и записи других процессов
+            if self.version_conn is None:
+                self.version_conn = sqlite3.connect(self.db_name, check_same_thread=False)
+            data_version = self.version_conn.execute('PRAGMA data_version').fetchone()[0]
+            return self.write_version, data_version
+    
+    def cached_query(self, key, query, params=()):
+        """Выборка с кэшированием до следующего изменения данных"""
+        stamp = self.get_data_stamp()
+        with self.cache_lock:
+            entry = self.query_cache.get(key)
+            if entry is not None and entry[0] == stamp:
+                return list(entry[1])
+        
+        cursor = self.get_connection().cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        # Отметка взята до чтения: запись во время чтения сделает запись кэша устаревшей
+        with self.cache_lock:
+            self.query_cache[key] = (stamp, rows)
+        return list(rows)
+    
+    def clear_cache(self):
+        """Сброс кэшей выборок и заявок"""
+        with self.cache_lock:
+            self.query_cache.clear()
+        with self.order_cache_lock:
+            self.order_cache.clear()
+            self.order_cache_stamp = None
     
     def init_database(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применение недостающих миграций схемы"""
         try:
-            # Удаляем старую базу данных для пересоздания
-            if os.path.exists(self.db_name):
-                os.remove(self.db_name)
-                self.logger.info("Удалена старая база данных")
-            
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Таблица типов материалов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS material_types (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    material_type TEXT UNIQUE NOT NULL,
-                    defect_percentage REAL NOT NULL
-                )
-            ''')
-            
-            # Таблица типов продукции
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS product_types (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_type TEXT UNIQUE NOT NULL,
-                    type_coefficient REAL NOT NULL
-                )
-            ''')
-            
-            # Таблица продукции
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_type TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    article TEXT UNIQUE NOT NULL,
-                    min_partner_price REAL NOT NULL,
-                    package_length REAL,
-                    package_width REAL,
-                    package_height REAL,
-                    weight_without_package REAL,
-                    weight_with_package REAL,
-                    quality_certificate BLOB,
-                    standard_number TEXT,
-                    price_history TEXT,
-                    production_time INTEGER,
-                    cost_price REAL,
-                    workshop_number INTEGER,
-                    workers_count INTEGER,
-                    required_materials TEXT,
-                    stock_quantity INTEGER DEFAULT 0,
-                    FOREIGN KEY (product_type) REFERENCES product_types(product_type)
-                )
-            ''')
-            
-            # Таблица партнеров
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS partners (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    partner_type TEXT NOT NULL,
-                    company_name TEXT NOT NULL,
-                    legal_address TEXT NOT NULL,
-                    inn TEXT UNIQUE NOT NULL,
-                    director_name TEXT NOT NULL,
-                    email TEXT NOT NULL,
-                    phone TEXT NOT NULL,
-                    logo BLOB,
-                    rating INTEGER DEFAULT 5,
-                    sales_locations TEXT,
-                    discount_history TEXT
-                )
-            ''')
-            
-            # Таблица сотрудников
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS employees (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    full_name TEXT NOT NULL,
-                    birth_date TEXT,
-                    passport_data TEXT,
-                    bank_details TEXT,
-                    family_status TEXT,
-                    health_status TEXT,
-                    equipment_access TEXT,
-                    position TEXT DEFAULT 'Менеджер'
-                )
-            ''')
-            
-            # Таблица заявок
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    partner_id INTEGER NOT NULL,
-                    manager_id INTEGER,
-                    order_date TEXT NOT NULL,
-                    status TEXT NOT NULL,
-                    products_list TEXT NOT NULL,
-                    total_cost REAL,
-                    production_date TEXT,
-                    prepayment_received BOOLEAN DEFAULT FALSE,
-                    prepayment_date TEXT,
-                    prepayment_amount REAL DEFAULT 0,
-                    full_payment_received BOOLEAN DEFAULT FALSE,
-                    full_payment_date TEXT,
-                    delivery_method TEXT,
-                    completion_date TEXT,
-                    notes TEXT,
-                    FOREIGN KEY (partner_id) REFERENCES partners(id),
-                    FOREIGN KEY (manager_id) REFERENCES employees(id)
-                )
-            ''')
-            
-            # Таблица истории продаж
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sales_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    partner_id INTEGER NOT NULL,
-                    product_id INTEGER NOT NULL,
-                    quantity INTEGER NOT NULL,
-                    sale_date TEXT NOT NULL,
-                    total_amount REAL,
-                    FOREIGN KEY (partner_id) REFERENCES partners(id),
-                    FOREIGN KEY (product_id) REFERENCES products(id)
-                )
-            ''')
-            
-            # Таблица истории рейтингов партнеров
+            started = time.perf_counter()
+            current_version = self.get_schema_version()
+            pending = [m for m in self.MIGRATIONS if m[0] > current_version]
+            
+            for version, description, method_name in pending:
+                with self.transaction() as cursor:
+                    # Другой процесс мог применить миграцию, пока мы ждали блокировку
+                    if self.get_schema_version() >= version:
+                        continue
+                    getattr(self, method_name)(cursor)
+                    cursor.execute('''
+                        INSERT INTO schema_migrations (version, description, applied_at)
+                        VALUES (?, ?, ?)
+                    ''', (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                self.logger.info(f"Применена миграция схемы #{version}: {description}")
+            
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.logger.info(
+                f"База данных успешно инициализирована "
+                f"(версия схемы {self.get_schema_version()}, {elapsed_ms:.1f} мс)"
+            )
+        
+        except sqlite3.Error as e:
+            self.log_error(f"Ошибка инициализации базы данных: {e}")
+    
+    def get_schema_version(self):
+        """Получение текущей версии схемы (0 для пустой базы)"""
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'")
+        if cursor.fetchone() is None:
+            return 0
+        cursor.execute('SELECT MAX(version) FROM schema_migrations')
+        return cursor.fetchone()[0] or 0
+    
+    def migrate_initial_schema(self, cursor):
+        """Миграция 1: таблицы предметной области и начальные данные"""
+        # Журнал примененных миграций
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        ''')
+        
+        # Таблица типов материалов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS material_types (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                material_type TEXT UNIQUE NOT NULL,
+                defect_percentage REAL NOT NULL
+            )
+        ''')
+        
+        # Таблица типов продукции
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_types (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_type TEXT UNIQUE NOT NULL,
+                type_coefficient REAL NOT NULL
+            )
+        ''')
+        
+        # Таблица продукции
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_type TEXT NOT NULL,
+                name TEXT NOT NULL,
+                article TEXT UNIQUE NOT NULL,
+                min_partner_price REAL NOT NULL,
+                package_length REAL,
+                package_width REAL,
+                package_height REAL,
+                weight_without_package REAL,
+                weight_with_package REAL,
+                quality_certificate BLOB,
+                standard_number TEXT,
+                price_history TEXT,
+                production_time INTEGER,
+                cost_price REAL,
+                workshop_number INTEGER,
+                workers_count INTEGER,
+                required_materials TEXT,
+                stock_quantity INTEGER DEFAULT 0,
+                FOREIGN KEY (product_type) REFERENCES product_types(product_type)
+            )
+        ''')
+        
+        # Таблица партнеров
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS partners (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                partner_type TEXT NOT NULL,
+                company_name TEXT NOT NULL,
+                legal_address TEXT NOT NULL,
+                inn TEXT UNIQUE NOT NULL,
+                director_name TEXT NOT NULL,
+                email TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                logo BLOB,
+                rating INTEGER DEFAULT 5,
+                sales_locations TEXT,
+                discount_history TEXT
+            )
+        ''')
+        
+        # Таблица сотрудников
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS employees (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                full_name TEXT NOT NULL,
+                birth_date TEXT,
+                passport_data TEXT,
+                bank_details TEXT,
+                family_status TEXT,
+                health_status TEXT,
+                equipment_access TEXT,
+                position TEXT DEFAULT 'Менеджер'
+            )
+        ''')
+        
+        # Таблица заявок
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                partner_id INTEGER NOT NULL,
+                manager_id INTEGER,
+                order_date TEXT NOT NULL,
+                status TEXT NOT NULL,
+                products_list TEXT NOT NULL,
+                total_cost REAL,
+                production_date TEXT,
+                prepayment_received BOOLEAN DEFAULT FALSE,
+                prepayment_date TEXT,
+                prepayment_amount REAL DEFAULT 0,
+                full_payment_received BOOLEAN DEFAULT FALSE,
+                full_payment_date TEXT,
+                delivery_method TEXT,
+                completion_date TEXT,
+                notes TEXT,
+                FOREIGN KEY (partner_id) REFERENCES partners(id),
+                FOREIGN KEY (manager_id) REFERENCES employees(id)
+            )
+        ''')
+        
+        # Таблица истории продаж
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                partner_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                sale_date TEXT NOT NULL,
+                total_amount REAL,
+                FOREIGN KEY (partner_id) REFERENCES partners(id),
+                FOREIGN KEY (product_id) REFERENCES products(id)
+            )
+        ''')
+        
+        # Таблица истории рейтингов партнеров
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS partner_rating_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                partner_id INTEGER NOT NULL,
+                old_rating INTEGER,
+                new_rating INTEGER,
+                change_date TEXT NOT NULL,
+                changed_by INTEGER,
+                reason TEXT,
+                FOREIGN KEY (partner_id) REFERENCES partners(id),
+                FOREIGN KEY (changed_by) REFERENCES employees(id)
+            )
+        ''')
+        
+        # Добавляем тестовых менеджеров (база могла быть создана до введения миграций)
+        for full_name, position in (('Иванов Иван Иванович', 'Старший менеджер'),
+                                    ('Петрова Мария Сергеевна', 'Менеджер по продажам')):
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS partner_rating_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    partner_id INTEGER NOT NULL,
-                    old_rating INTEGER,
-                    new_rating INTEGER,
-                    change_date TEXT NOT NULL,
-                    changed_by INTEGER,
-                    reason TEXT,
-                    FOREIGN KEY (partner_id) REFERENCES partners(id),
-                    FOREIGN KEY (changed_by) REFERENCES employees(id)
+                INSERT INTO employees (full_name, position)
+                SELECT ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM employees WHERE full_name = ?)
+            ''', (full_name, position, full_name))
+    
+    def migrate_indexes(self, cursor):
+        """Миграция 2: индексы для частых выборок и фильтров"""
+        # Статистика партнера: фильтр по partner_id, агрегаты берутся прямо из индекса
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sales_history_partner
+            ON sales_history (partner_id, product_id, quantity, total_amount)
+        ''')
+        # Топ продуктов: группировка по product_id без обращения к таблице
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sales_history_product
+            ON sales_history (product_id, quantity, total_amount)
+        ''')
+        # Поиск и сортировка по названиям
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_partners_company_name ON partners (company_name)')
+        # Фильтр заявок по статусу и сроку, сортировка по дате
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_date ON orders (status, order_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders (order_date)')
+    
+    def migrate_partner_sales_summary(self, cursor):
+        """Миграция 3: сводка продаж по партнерам, обновляемая триггерами"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS partner_sales_summary (
+                partner_id INTEGER PRIMARY KEY,
+                total_quantity INTEGER NOT NULL DEFAULT 0,
+                total_amount REAL NOT NULL DEFAULT 0,
+                unique_products INTEGER NOT NULL DEFAULT 0,
+                sales_count INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (partner_id) REFERENCES partners(id)
+            )
+        ''')
+        
+        # Заполнение по уже накопленной истории
+        cursor.execute('DELETE FROM partner_sales_summary')
+        cursor.execute('''
+            INSERT INTO partner_sales_summary
+            (partner_id, total_quantity, total_amount, unique_products, sales_count)
+            SELECT partner_id, SUM(quantity), COALESCE(SUM(total_amount), 0),
+                   COUNT(DISTINCT product_id), COUNT(*)
+            FROM sales_history
+            GROUP BY partner_id
+        ''')
+        
+        # Уникальный продукт учитывается, если других продаж этой пары партнер-продукт нет
+        new_pair_exists = self.SALES_PAIR_EXISTS_SQL.format(
+            partner_id='NEW.partner_id', product_id='NEW.product_id', id='NEW.id')
+        old_pair_exists = self.SALES_PAIR_EXISTS_SQL.format(
+            partner_id='OLD.partner_id', product_id='OLD.product_id', id='OLD.id')
+        add_sale = f'''
+            INSERT INTO partner_sales_summary
+            (partner_id, total_quantity, total_amount, unique_products, sales_count)
+            VALUES (
+                NEW.partner_id, NEW.quantity, COALESCE(NEW.total_amount, 0),
+                NOT EXISTS ({new_pair_exists}),
+                1
+            )
+            ON CONFLICT(partner_id) DO UPDATE SET
+                total_quantity = total_quantity + excluded.total_quantity,
+                total_amount = total_amount + excluded.total_amount,
+                unique_products = unique_products + excluded.unique_products,
+                sales_count = sales_count + 1;
+        '''
+        remove_sale = f'''
+            UPDATE partner_sales_summary SET
+                total_quantity = total_quantity - OLD.quantity,
+                total_amount = total_amount - COALESCE(OLD.total_amount, 0),
+                unique_products = unique_products - NOT EXISTS ({old_pair_exists}),
+                sales_count = sales_count - 1
+            WHERE partner_id = OLD.partner_id;
+        '''
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_sales_history_insert
+            AFTER INSERT ON sales_history
+            BEGIN {add_sale} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_sales_history_delete
+            AFTER DELETE ON sales_history
+            BEGIN {remove_sale} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_sales_history_update
+            AFTER UPDATE OF partner_id, product_id, quantity, total_amount ON sales_history
+            BEGIN {remove_sale} {add_sale} END
+        ''')
+    
+    def migrate_order_items(self, cursor):
+        """Миграция 4: позиции заявок вместо JSON в orders.products_list"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS order_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                price REAL NOT NULL,
+                total REAL NOT NULL,
+                FOREIGN KEY (order_id) REFERENCES orders(id),
+                FOREIGN KEY (product_id) REFERENCES products(id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_order_items_product
+            ON order_items (product_id, quantity, total)
+        ''')
+        
+        # Перенос состава существующих заявок из JSON
+        cursor.execute('''
+            INSERT INTO order_items (order_id, product_id, quantity, price, total)
+            SELECT o.id,
+                   json_extract(item.value, '$.product_id'),
+                   json_extract(item.value, '$.quantity'),
+                   json_extract(item.value, '$.price'),
+                   json_extract(item.value, '$.total')
+            FROM orders o, json_each(o.products_list) item
+            WHERE json_valid(o.products_list)
+            ORDER BY o.id, item.key
+        ''')
+        # Столбец остается ради совместимости схемы, данные теперь в order_items
+        cursor.execute("UPDATE orders SET products_list = '[]' WHERE json_valid(products_list)")
+    
+    def migrate_partners_fts(self, cursor):
+        """Миграция 5: полнотекстовый индекс FTS5 по партнерам"""
+        columns = [column for column, _ in self.PARTNER_SEARCH_COLUMNS]
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'NEW.{column}' for column in columns)
+        old_values = ', '.join(f'OLD.{column}' for column in columns)
+        try:
+            # Внешнее содержимое: индекс хранит только токены, текст берется из partners
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS partners_fts USING fts5(
+                    {column_list},
+                    content='partners', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
                 )
             ''')
-            
-            # Добавляем тестового менеджера
-            cursor.execute('''
-                INSERT OR IGNORE INTO employees 
-                (full_name, position) 
-                VALUES (?, ?)
-            ''', ('Иванов Иван Иванович', 'Старший менеджер'))
-            
-            cursor.execute('''
-                INSERT OR IGNORE INTO employees 
-                (full_name, position) 
-                VALUES (?, ?)
-            ''', ('Петрова Мария Сергеевна', 'Менеджер по продажам'))
-            
-            conn.commit()
-            self.logger.info("База данных успешно инициализирована")
-            
-        except sqlite3.Error as e:
-            self.logger.error(f"Ошибка инициализации базы данных: {e}")
-        finally:
-            conn.close()
+        except sqlite3.OperationalError as e:
+            # Сборка SQLite без FTS5: поиск работает через LIKE
+            self.logger.warning(f"FTS5 недоступен, поиск партнеров без индекса: {e}")
+            return
+        
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_partners_fts_insert
+            AFTER INSERT ON partners
+            BEGIN
+                INSERT INTO partners_fts (rowid, {column_list}) VALUES (NEW.id, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_partners_fts_delete
+            AFTER DELETE ON partners
+            BEGIN
+                INSERT INTO partners_fts (partners_fts, rowid, {column_list})
+                VALUES ('delete', OLD.id, {old_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_partners_fts_update
+            AFTER UPDATE OF {column_list} ON partners
+            BEGIN
+                INSERT INTO partners_fts (partners_fts, rowid, {column_list})
+                VALUES ('delete', OLD.id, {old_values});
+                INSERT INTO partners_fts (rowid, {column_list}) VALUES (NEW.id, {new_values});
+            END
+        ''')
+        # Заполнение индекса по уже загруженным партнерам
+        cursor.execute("INSERT INTO partners_fts (partners_fts) VALUES ('rebuild')")
+    
+    def check_query_plans(self):
+        """Проверка планов запросов Database: поиск полных сканирований таблиц
+        
+        Методы чтения выполняются с тестовыми аргументами, их запросы перехватываются;
+        запросы методов записи только разбираются EXPLAIN и данных не меняют.
+        """
+        conn = self.get_connection()
+        checks = []
+        for method_name, args, access in self.QUERY_PLAN_CHECKS:
+            # Ответ из кэша не выполнил бы запрос
+            self.clear_cache()
+            statements = []
+            conn.set_trace_callback(statements.append)
+            try:
+                getattr(self, method_name)(*args)
+            finally:
+                conn.set_trace_callback(None)
+            checks.extend((method_name, sql, (), access, None) for sql in statements)
+        self.clear_cache()
+        checks.extend(self.QUERY_PLAN_STATEMENTS)
+        
+        problems = []
+        # Отдельное соединение: кэш подготовленных EXPLAIN не видит изменений схемы
+        explain_conn = sqlite3.connect(self.db_name)
+        for method_name, sql, params, access, index in checks:
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                continue
+            # Служебные запросы расширений (FTS5) к своим теневым таблицам
+            if "'main'." in sql:
+                continue
+            plan = [row[3] for row in explain_conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            # Подзапросы, уже посчитанные во временную таблицу, сканировать можно
+            subqueries = {detail.split()[-1] for detail in plan
+                          if detail.startswith(('MATERIALIZE', 'CO-ROUTINE'))}
+            for detail in plan:
+                # "SCAN t" - чтение всей таблицы, "SCAN t USING INDEX" - всего индекса,
+                # "SCAN f VIRTUAL TABLE INDEX 0:M5" - поиск по ограничению виртуальной таблицы
+                virtual_search = 'VIRTUAL TABLE INDEX' in detail and not detail.endswith(':')
+                # json_each перебирает переданный в параметре список id, а не строки таблицы
+                parameter_list = detail.split()[1:2] == ['json_each']
+                full_scan = (detail.startswith('SCAN') and detail.split()[1] not in subqueries
+                             and not virtual_search and not parameter_list
+                             and ('USING' not in detail or access == 'seek'))
+                # Сортировать можно только найденные строки, но не весь список
+                temp_sort = detail.startswith('USE TEMP B-TREE') and access == 'ordered'
+                if full_scan or temp_sort:
+                    problems.append((method_name, detail))
+                    self.logger.warning(f"Неэффективный план в {method_name}: {detail}")
+            # Поиск по другому индексу тоже "seek", но перебирает лишние строки
+            if index is not None and not any(detail.startswith('SEARCH') and f'INDEX {index}' in detail
+                                             for detail in plan):
+                detail = f"нет поиска по {index}: {'; '.join(plan)}"
+                problems.append((method_name, detail))
+                self.logger.warning(f"Неэффективный план в {method_name}: {detail}")
+        explain_conn.close()
+        
+        if not problems:
+            self.logger.info(f"Планы запросов в порядке ({len(checks)} запросов)")
+        return problems
 
-    def import_partners(self, file_path):
+    def import_partners(self, file_path, chunk_size=None, cancel_event=None, progress=None):
         """Импорт данных о партнерах из Excel файла"""
-        try:
-            df = pd.read_excel(file_path)
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            for _, row in df.iterrows():
-                cursor.execute('''
-                    INSERT OR REPLACE INTO partners 
-                    (partner_type, company_name, director_name, email, phone, legal_address, inn, rating)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    row['Тип партнера'],
-                    row['Наименование партнера'],
-                    row['Директор'],
-                    row['Электронная почта партнера'],
-                    row['Телефон партнера'],
-                    row['Юридический адрес партнера'],
-                    row['ИНН'],
-                    row['Рейтинг']
-                ))
-            
-            conn.commit()
-            self.logger.info(f"Импортировано {len(df)} партнеров")
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Ошибка импорта партнеров: {e}")
-            return False
-        finally:
-            conn.close()
+        return self.import_excel(file_path, 'partners', chunk_size, cancel_event, progress)
     
-    def import_material_types(self, file_path):
+    def import_material_types(self, file_path, chunk_size=None, cancel_event=None, progress=None):
         """Импорт типов материалов из Excel файла"""
-        try:
-            df = pd.read_excel(file_path)
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            for _, row in df.iterrows():
-                cursor.execute('''
-                    INSERT OR REPLACE INTO material_types 
-                    (material_type, defect_percentage)
-                    VALUES (?, ?)
-                ''', (row['Тип материала'], row['Процент брака материала']))
-            
-            conn.commit()
-            self.logger.info(f"Импортировано {len(df)} типов материалов")
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Ошибка импорта типов материалов: {e}")
-            return False
-        finally:
-            conn.close()
+        return self.import_excel(file_path, 'material_types', chunk_size, cancel_event, progress)
     
-    def import_product_types(self, file_path):
+    def import_product_types(self, file_path, chunk_size=None, cancel_event=None, progress=None):
         """Импорт типов продукции из Excel файла"""
+        return self.import_excel(file_path, 'product_types', chunk_size, cancel_event, progress)
+    
+    def import_products(self, file_path, chunk_size=None, cancel_event=None, progress=None):
+        """Импорт продукции из Excel файла"""
+        return self.import_excel(file_path, 'products', chunk_size, cancel_event, progress)
+    
+    def import_excel(self, file_path, kind, chunk_size=None, cancel_event=None, progress=None):
+        """Импорт Excel файла по описанию из IMPORT_SPECS"""
+        spec = IMPORT_SPECS[kind]
         try:
-            df = pd.read_excel(file_path)
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            for _, row in df.iterrows():
-                cursor.execute('''
-                    INSERT OR REPLACE INTO product_types 
-                    (product_type, type_coefficient)
-                    VALUES (?, ?)
-                ''', (row['Тип продукции'], row['Коэффициент типа продукции']))
-            
-            conn.commit()
-            self.logger.info(f"Импортировано {len(df)} типов продукции")
+            chunks = read_excel_chunks(file_path, chunk_size or self.IMPORT_CHUNK_SIZE)
+            self.bulk_load(track_chunks(chunks, cancel_event, progress), kind)
             return True
-            
+        
+        except ImportCancelled:
+            self.logger.warning(f"Импорт {spec['description']} отменен")
+            return False
         except Exception as e:
-            self.logger.error(f"Ошибка импорта типов продукции: {e}")
+            self.log_error(f"Ошибка импорта {spec['description']}: {e}")
             return False
+    
+    def import_files(self, sources, chunk_size=None, cancel_event=None, progress=None, max_workers=None):
+        """Импорт нескольких файлов с учетом зависимостей, каждый файл своей транзакцией
+        
+        sources - тип импорта из IMPORT_SPECS -> файл. Самый большой файл и файлы меньше
+        PARALLEL_IMPORT_MIN_BYTES читаются потоково в текущем потоке, остальные - параллельно
+        в процессах, которые складывают блоки во временные файлы. Ожидание чтения идет вне
+        транзакции и не блокирует другие записи.
+        
+        progress(тип, число строк) вызывается по мере загрузки блоков. Возвращает список
+        (тип, число строк, ошибка) в порядке загрузки; при отмене - только для файлов,
+        загруженных до нее (они сохраняются, прерванный файл откатывается).
+        """
+        order = import_order(sources)
+        chunk_size = chunk_size or self.IMPORT_CHUNK_SIZE
+        started = time.perf_counter()
+        sizes = {kind: os.path.getsize(sources[kind]) if os.path.isfile(sources[kind]) else 0 for kind in order}
+        largest = max(order, key=sizes.get, default=None)
+        pooled = [kind for kind in order if kind != largest and sizes[kind] >= self.PARALLEL_IMPORT_MIN_BYTES]
+        
+        results = []
+        failed = set()
+        executor = None
+        spool = tempfile.TemporaryDirectory(prefix='import_')
+        try:
+            futures = {}
+            if pooled:
+                # spawn: дочерние процессы не наследуют потоки и соединения SQLite родителя
+                executor = ProcessPoolExecutor(max_workers=max_workers or min(len(pooled), os.cpu_count() or 1),
+                                               mp_context=multiprocessing.get_context('spawn'))
+                for kind in pooled:
+                    directory = os.path.join(spool.name, kind)
+                    os.mkdir(directory)
+                    futures[kind] = executor.submit(spool_excel_chunks, sources[kind], chunk_size, directory)
+            
+            for kind in order:
+                spec = IMPORT_SPECS[kind]
+                missing = [dependency for dependency in IMPORT_DEPENDENCIES.get(kind, ()) if dependency in failed]
+                if missing:
+                    failed.add(kind)
+                    error = RuntimeError("не загружены данные " + ', '.join(IMPORT_SPECS[m]['description'] for m in missing))
+                    results.append((kind, 0, error))
+                    self.logger.error(f"Импорт {spec['description']} пропущен: {error}")
+                    continue
+                
+                try:
+                    if kind in futures:
+                        chunks = read_spooled_chunks(self.wait_for_import(futures[kind], cancel_event))
+                    else:
+                        chunks = read_excel_chunks(sources[kind], chunk_size)
+                    chunks = track_chunks(chunks, cancel_event,
+                                          None if progress is None else functools.partial(progress, kind))
+                    # Ошибка одного файла откатывает только его строки
+                    if kind == 'sales_history':
+                        rows = self.load_sales_history(chunks)
+                    else:
+                        rows = self.bulk_load(chunks, kind)
+                except ImportCancelled:
+                    raise
+                except Exception as e:
+                    failed.add(kind)
+                    results.append((kind, 0, e))
+                    self.log_error(f"Ошибка импорта {spec['description']}: {e}")
+                else:
+                    results.append((kind, rows, None))
+        
+        except ImportCancelled:
+            self.logger.warning("Импорт файлов отменен")
+            return results
         finally:
-            conn.close()
+            if executor is not None:
+                # Нужные результаты уже получены: чтения после отмены или ошибки зависимости
+                # прерываются, а каталог блоков удаляется после остановки процессов
+                stop_workers(executor)
+            spool.cleanup()
+        
+        self.logger.info(f"Импорт {len(order)} файлов завершен за {time.perf_counter() - started:.2f} с")
+        return results
     
-    def import_products(self, file_path):
-        """Импорт продукции из Excel файла"""
+    def wait_for_import(self, future, cancel_event=None):
+        """Ожидание результата чтения файла с проверкой отмены"""
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise ImportCancelled()
+            try:
+                return future.result(timeout=0.1)
+            except TimeoutError:
+                continue
+    
+    def bulk_load(self, chunks, kind):
+        """Массовая загрузка DataFrame (или последовательности блоков) одной транзакцией"""
+        import pandas as pd
+        spec = IMPORT_SPECS[kind]
+        started = time.perf_counter()
+        if isinstance(chunks, pd.DataFrame):
+            chunks = [chunks]
+        chunks = prefetch_first(chunks)
+        
+        rows = 0
+        with self.transaction():
+            # Блоки вставляются по мере чтения файла
+            for df in chunks:
+                columns = prepare_import_columns(df, spec['columns'])
+                rows += self.insert_columns(spec['table'], columns, spec['key'])
+        
+        self.log_import_speed(rows, spec['description'], started)
+        return rows
+    
+    def insert_columns(self, table, columns, key=None):
+        """Вставка столбцов (столбец -> список значений) через executemany"""
+        table_columns = list(columns)
+        placeholders = ', '.join('?' for _ in table_columns)
+        sql = f"INSERT INTO {table} ({', '.join(table_columns)}) VALUES ({placeholders})"
+        if key:
+            # UPSERT вместо INSERT OR REPLACE: id существующих строк не меняется
+            updates = ', '.join(f'{col} = excluded.{col}' for col in table_columns if col != key)
+            sql += f" ON CONFLICT({key}) DO UPDATE SET {updates}"
+        
+        with self.transaction() as cursor:
+            cursor.executemany(sql, zip(*columns.values()))
+        return len(next(iter(columns.values()), []))
+    
+    def log_import_speed(self, rows, description, started):
+        """Запись в лог количества и скорости импорта"""
+        elapsed = time.perf_counter() - started
+        self.logger.info(
+            f"Импортировано {rows} {description} "
+            f"за {elapsed:.2f} с ({rows / elapsed if elapsed else 0:,.0f} строк/с)"
+        )
+    
+    def import_sales_history(self, file_path, reject_report_path=None, chunk_size=None,
+                             cancel_event=None, progress=None):
+        """Импорт истории продаж из Excel файла"""
         try:
-            df = pd.read_excel(file_path)
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            for _, row in df.iterrows():
-                cursor.execute('''
-                    INSERT OR REPLACE INTO products 
-                    (product_type, name, article, min_partner_price)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    row['Тип продукции'],
-                    row['Наименование продукции'],
-                    row['Артикул'],
-                    row['Минимальная стоимость для партнера']
-                ))
-            
-            conn.commit()
-            self.logger.info(f"Импортировано {len(df)} продуктов")
+            chunks = read_excel_chunks(file_path, chunk_size or self.IMPORT_CHUNK_SIZE)
+            self.load_sales_history(track_chunks(chunks, cancel_event, progress), reject_report_path)
             return True
-            
+        
+        except ImportCancelled:
+            self.logger.warning("Импорт истории продаж отменен")
+            return False
         except Exception as e:
-            self.logger.error(f"Ошибка импорта продуктов: {e}")
+            self.log_error(f"Ошибка импорта истории продаж: {e}")
             return False
-        finally:
-            conn.close()
     
-    def import_sales_history(self, file_path):
-        """Импорт истории продаж из Excel файла"""
+    def load_sales_history(self, chunks, reject_report_path=None):
+        """Загрузка истории продаж: сопоставление названий через merge и массовая вставка"""
+        import pandas as pd
+        spec = IMPORT_SPECS['sales_history']
+        started = time.perf_counter()
+        if isinstance(chunks, pd.DataFrame):
+            chunks = [chunks]
+        
+        # Справочники загружаются один раз; при дублях названий берется первая запись, как раньше
+        conn = self.get_connection()
+        partners = pd.read_sql_query(
+            'SELECT id AS partner_id, company_name FROM partners ORDER BY id', conn
+        ).drop_duplicates('company_name')
+        products = pd.read_sql_query(
+            'SELECT id AS product_id, name AS product_name, min_partner_price FROM products ORDER BY id', conn
+        ).drop_duplicates('product_name')
+        chunks = prefetch_first(chunks)
+        
+        rows = 0
+        rejects = Counter()
+        report_columns = [column for column, _ in spec['columns'].values()] + ['reject_reason']
+        report = None
         try:
-            df = pd.read_excel(file_path)
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            imported_count = 0
-            for _, row in df.iterrows():
-                # Получаем ID партнера и продукта
-                cursor.execute('SELECT id FROM partners WHERE company_name = ?', (row['Наименование партнера'],))
-                partner_result = cursor.fetchone()
-                
-                cursor.execute('SELECT id FROM products WHERE name = ?', (row['Продукция'],))
-                product_result = cursor.fetchone()
-                
-                if partner_result and product_result:
-                    partner_id = partner_result[0]
-                    product_id = product_result[0]
+            with self.transaction():
+                for df in chunks:
+                    sales = pd.DataFrame(prepare_import_columns(df, spec['columns']))
+                    sales['quantity'] = sales['quantity'].astype('Int64')
                     
-                    # Получаем стоимость продукта для расчета общей суммы
-                    cursor.execute('SELECT min_partner_price FROM products WHERE id = ?', (product_id,))
-                    price_result = cursor.fetchone()
-                    total_amount = price_result[0] * row['Количество продукции'] if price_result else 0
+                    merged = (sales
+                              .merge(partners, on='company_name', how='left')
+                              .merge(products, on='product_name', how='left'))
+                    merged['reject_reason'] = None
+                    merged.loc[merged['quantity'].isna() | merged['sale_date'].isna(), 'reject_reason'] = 'Не указаны количество или дата'
+                    merged.loc[merged['product_id'].isna(), 'reject_reason'] = 'Продукт не найден'
+                    merged.loc[merged['partner_id'].isna(), 'reject_reason'] = 'Партнер не найден'
                     
-                    cursor.execute('''
-                        INSERT INTO sales_history 
-                        (partner_id, product_id, quantity, sale_date, total_amount)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        partner_id,
-                        product_id,
-                        row['Количество продукции'],
-                        row['Дата продажи'],
-                        total_amount
-                    ))
-                    imported_count += 1
-            
-            conn.commit()
-            self.logger.info(f"Импортировано {imported_count} записей истории продаж")
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Ошибка импорта истории продаж: {e}")
-            return False
+                    rejected = merged['reject_reason'].notna()
+                    matched = merged.loc[~rejected]
+                    quantity = pd.to_numeric(matched['quantity'])
+                    rows += self.insert_columns('sales_history', {
+                        'partner_id': coerce_column(matched['partner_id'], 'int'),
+                        'product_id': coerce_column(matched['product_id'], 'int'),
+                        'quantity': coerce_column(quantity, 'int'),
+                        'sale_date': matched['sale_date'].tolist(),
+                        'total_amount': coerce_column(matched['min_partner_price'] * quantity, 'real'),
+                    })
+                    if not rejected.any():
+                        continue
+                    # Отклоненные строки дописываются в отчет по блокам и в памяти не копятся
+                    rejects.update(merged.loc[rejected, 'reject_reason'])
+                    if reject_report_path:
+                        if report is None:
+                            report = open(reject_report_path, 'w', encoding='utf-8-sig', newline='')
+                        merged.loc[rejected, report_columns].to_csv(report, index=False, header=report.tell() == 0)
         finally:
-            conn.close()
+            if report is not None:
+                report.close()
+        self.log_import_speed(rows, spec['description'], started)
+        
+        # Отчет об отклоненных строках вместо молчаливого пропуска
+        self.last_import_rejects = dict(rejects)
+        if rejects:
+            summary = ', '.join(f"{reason}: {count}" for reason, count in rejects.most_common())
+            self.logger.warning(f"Отклонено {sum(rejects.values())} записей истории продаж ({summary})")
+            if report is not None:
+                self.logger.warning(f"Отчет об отклоненных записях: {reject_report_path}")
+        return rows
     
     def get_all_partners(self):
         """Получение всех партнеров"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM partners ORDER BY company_name')
-            return cursor.fetchall()
+            return self.cached_query('all_partners', 'SELECT * FROM partners ORDER BY company_name')
         except Exception as e:
-            self.logger.error(f"Ошибка получения партнеров: {e}")
+            self.log_error(f"Ошибка получения партнеров: {e}")
             return []
-        finally:
-            conn.close()
 
     def get_all_products(self):
         """Получение всей продукции"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM products ORDER BY name')
-            return cursor.fetchall()
+            return self.cached_query('all_products', 'SELECT * FROM products ORDER BY name')
         except Exception as e:
-            self.logger.error(f"Ошибка получения продукции: {e}")
+            self.log_error(f"Ошибка получения продукции: {e}")
             return []
-        finally:
-            conn.close()
 
     def get_product_by_name(self, product_name):
         """Получение продукта по названию"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            cursor = self.get_connection().cursor()
             cursor.execute('SELECT * FROM products WHERE name = ?', (product_name,))
             return cursor.fetchone()
         except Exception as e:
-            self.logger.error(f"Ошибка получения продукта: {e}")
+            self.log_error(f"Ошибка получения продукта: {e}")
             return None
-        finally:
-            conn.close()
 
     def get_partner_by_name(self, partner_name):
         """Получение партнера по названию"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            cursor = self.get_connection().cursor()
             cursor.execute('SELECT * FROM partners WHERE company_name = ?', (partner_name,))
             return cursor.fetchone()
         except Exception as e:
-            self.logger.error(f"Ошибка получения партнера: {e}")
+            self.log_error(f"Ошибка получения партнера: {e}")
             return None
-        finally:
-            conn.close()
+    
+    def partner_search_filter(self, term):
+        """Условия поиска партнеров: (выражение MATCH для FTS5, условие и параметры LIKE без индекса)
+        
+        Каждое слово ищется как префикс; кавычки экранируют синтаксис FTS5. None для пустой строки.
+        """
+        tokens = re.findall(r'\w+', term)
+        if not tokens:
+            return None
+        # Без индекса (SQLite без FTS5) все слова должны встретиться в одном из полей
+        columns = [column for column, _ in self.PARTNER_SEARCH_COLUMNS]
+        conditions = ' AND '.join(
+            '(' + ' OR '.join(f'{column} LIKE ?' for column in columns) + ')'
+            for _ in tokens
+        )
+        params = [f'%{token}%' for token in tokens for _ in columns]
+        return ' '.join(f'"{token}"*' for token in tokens), conditions, params
+    
+    def search_partners(self, term, limit=100, offset=0):
+        """Поиск партнеров по началу слов названия, директора, ИНН, email и телефона
+        
+        Возвращает limit совпадений начиная с offset; всего их - count_partner_matches().
+        """
+        search = self.partner_search_filter(term)
+        if search is None:
+            return []
+        match, conditions, params = search
+        try:
+            cursor = self.get_connection().cursor()
+            weights = ', '.join(str(weight) for _, weight in self.PARTNER_SEARCH_COLUMNS)
+            try:
+                cursor.execute(f'''
+                    SELECT p.*
+                    FROM partners_fts f
+                    JOIN partners p ON p.id = f.rowid
+                    WHERE partners_fts MATCH ?
+                    ORDER BY bm25(partners_fts, {weights}), p.company_name
+                    LIMIT ? OFFSET ?
+                ''', (match, limit, offset))
+            except sqlite3.OperationalError:
+                cursor.execute(f'''
+                    SELECT * FROM partners
+                    WHERE {conditions}
+                    ORDER BY company_name
+                    LIMIT ? OFFSET ?
+                ''', params + [limit, offset])
+            return cursor.fetchall()
+        except Exception as e:
+            self.log_error(f"Ошибка поиска партнеров: {e}")
+            return []
+    
+    def count_partner_matches(self, term):
+        """Число партнеров, найденных search_partners() по строке поиска"""
+        search = self.partner_search_filter(term)
+        if search is None:
+            return 0
+        match, conditions, params = search
+        try:
+            cursor = self.get_connection().cursor()
+            try:
+                cursor.execute('SELECT COUNT(*) FROM partners_fts WHERE partners_fts MATCH ?', (match,))
+            except sqlite3.OperationalError:
+                cursor.execute(f'SELECT COUNT(*) FROM partners WHERE {conditions}', params)
+            return cursor.fetchone()[0]
+        except Exception as e:
+            self.log_error(f"Ошибка подсчета найденных партнеров: {e}")
+            return 0
 
     def get_all_employees(self):
         """Получение всех сотрудников"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM employees ORDER BY full_name')
-            return cursor.fetchall()
+            return self.cached_query('all_employees', 'SELECT * FROM employees ORDER BY full_name')
         except Exception as e:
-            self.logger.error(f"Ошибка получения сотрудников: {e}")
+            self.log_error(f"Ошибка получения сотрудников: {e}")
             return []
-        finally:
-            conn.close()
 
     def get_all_orders(self):
         """Получение всех заявок"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            cursor = self.get_connection().cursor()
             cursor.execute('''
                 SELECT o.*, p.company_name, e.full_name as manager_name
                 FROM orders o
@@ -420,16 +1314,13 @@ class Database:
             ''')
             return cursor.fetchall()
         except Exception as e:
-            self.logger.error(f"Ошибка получения заявок: {e}")
+            self.log_error(f"Ошибка получения заявок: {e}")
             return []
-        finally:
-            conn.close()
 
     def get_orders_by_status(self, status):
         """Получение заявок по статусу"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            cursor = self.get_connection().cursor()
             cursor.execute('''
                 SELECT o.*, p.company_name, e.full_name as manager_name
                 FROM orders o
@@ -440,177 +1331,342 @@ class Database:
             ''', (status,))
             return cursor.fetchall()
         except Exception as e:
-            self.logger.error(f"Ошибка получения заявок: {e}")
+            self.log_error(f"Ошибка получения заявок: {e}")
             return []
-        finally:
-            conn.close()
+    
+    def get_page(self, source, cursor=None, page_size=100, status=None):
+        """Постраничная выборка по ключу (keyset): возвращает (строки, курсор следующей страницы)"""
+        spec = self.PAGE_SOURCES[source]
+        where, params = self.page_filter(spec, status, cursor)
+        # Лишняя строка показывает, есть ли следующая страница
+        query = f"{spec['select']}{where}{self.page_order(spec)} LIMIT ?"
+        params.append(page_size + 1)
+        
+        cursor_obj = self.get_connection().cursor()
+        cursor_obj.execute(query, params)
+        rows = cursor_obj.fetchall()
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        return rows, tuple(rows[-1][position] for position in spec['key_positions'])
+    
+    def page_filter(self, spec, status=None, cursor=None):
+        """Условие WHERE постраничной выборки и его параметры"""
+        conditions = []
+        params = []
+        if status is not None:
+            conditions.append(f"{spec['status_column']} = ?")
+            params.append(status)
+        if cursor is not None:
+            # Сравнение кортежей (ключ, id) продолжает выборку с места остановки по индексу
+            operator = '<' if spec['descending'] else '>'
+            conditions.append(f"({', '.join(spec['key'])}) {operator} ({', '.join('?' for _ in cursor)})")
+            params.extend(cursor)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return where, params
+    
+    def page_order(self, spec):
+        """ORDER BY постраничной выборки"""
+        direction = 'DESC' if spec['descending'] else 'ASC'
+        return ' ORDER BY ' + ', '.join(f'{column} {direction}' for column in spec['key'])
+    
+    def count_rows(self, source, status=None):
+        """Число строк источника постраничной выборки"""
+        try:
+            spec = self.PAGE_SOURCES[source]
+            where, params = self.page_filter(spec, status)
+            cursor = self.get_connection().cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM {spec['table']}{where}", params)
+            return cursor.fetchone()[0]
+        except Exception as e:
+            self.log_error(f"Ошибка подсчета строк: {e}")
+            return 0
+    
+    def get_page_at(self, source, offset, page_size=100, status=None, cursor=None):
+        """Страница с позиции offset; cursor - ключ предыдущей строки, если он уже известен"""
+        try:
+            if offset <= 0 or cursor is not None:
+                return self.get_page(source, cursor, page_size, status)
+            spec = self.PAGE_SOURCES[source]
+            where, params = self.page_filter(spec, status)
+            # Ключ строки перед позицией берется из индекса без чтения самих строк,
+            # дальше обычная выборка по ключу
+            cursor = self.get_connection().cursor()
+            cursor.execute(
+                f"SELECT {', '.join(spec['key'])} FROM {spec['table']}{where}"
+                f"{self.page_order(spec)} LIMIT 1 OFFSET ?",
+                params + [offset - 1]
+            )
+            key = cursor.fetchone()
+            if key is None:
+                return [], None
+            return self.get_page(source, tuple(key), page_size, status)
+        except Exception as e:
+            self.log_error(f"Ошибка получения страницы: {e}")
+            return [], None
+    
+    def get_partners_page(self, cursor=None, page_size=100):
+        """Страница партнеров в порядке названия"""
+        try:
+            return self.get_page('partners', cursor, page_size)
+        except Exception as e:
+            self.log_error(f"Ошибка получения партнеров: {e}")
+            return [], None
+    
+    def get_products_page(self, cursor=None, page_size=100):
+        """Страница продукции в порядке названия"""
+        try:
+            return self.get_page('products', cursor, page_size)
+        except Exception as e:
+            self.log_error(f"Ошибка получения продукции: {e}")
+            return [], None
+    
+    def get_orders_page(self, cursor=None, page_size=100, status=None):
+        """Страница заявок (новые сначала), с необязательным фильтром по статусу"""
+        try:
+            return self.get_page('orders', cursor, page_size, status)
+        except Exception as e:
+            self.log_error(f"Ошибка получения заявок: {e}")
+            return [], None
 
     def create_order(self, partner_id, manager_id, products_list, total_cost, delivery_method=None):
         """Создание новой заявки"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            order_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            cursor.execute('''
-                INSERT INTO orders 
-                (partner_id, manager_id, order_date, status, products_list, total_cost, delivery_method)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                partner_id,
-                manager_id,
-                order_date,
-                'created',
-                json.dumps(products_list),
-                total_cost,
-                delivery_method
-            ))
+            with self.transaction() as cursor:
+                order_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                
+                cursor.execute('''
+                    INSERT INTO orders 
+                    (partner_id, manager_id, order_date, status, products_list, total_cost, delivery_method)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    partner_id,
+                    manager_id,
+                    order_date,
+                    'created',
+                    '[]',  # состав заявки хранится в order_items
+                    total_cost,
+                    delivery_method
+                ))
+                
+                order_id = cursor.lastrowid
+                cursor.executemany('''
+                    INSERT INTO order_items (order_id, product_id, quantity, price, total)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [
+                    (order_id, item['product_id'], item['quantity'], item['price'], item['total'])
+                    for item in products_list
+                ])
             
-            order_id = cursor.lastrowid
-            conn.commit()
             self.logger.info(f"Создана заявка #{order_id} для партнера #{partner_id}")
             
             return order_id
-            
+        
         except Exception as e:
-            self.logger.error(f"Ошибка создания заявки: {e}")
+            self.log_error(f"Ошибка создания заявки: {e}")
             return None
-        finally:
-            conn.close()
+    
+    def get_order(self, order_id):
+        """Получение заявки по id: поля заявки, партнер, менеджер и состав (с LRU-кэшем)"""
+        stamp = self.get_data_stamp()
+        with self.order_cache_lock:
+            # После любого изменения данных кэш заявок начинается заново
+            if self.order_cache_stamp != stamp:
+                self.order_cache.clear()
+                self.order_cache_stamp = stamp
+            order = self.order_cache.get(order_id)
+            if order is not None:
+                self.order_cache.move_to_end(order_id)
+                return dict(order)
+        
+        try:
+            cursor = self.get_connection().cursor()
+            cursor.execute('''
+                SELECT o.*, p.company_name, e.full_name as manager_name
+                FROM orders o
+                LEFT JOIN partners p ON o.partner_id = p.id
+                LEFT JOIN employees e ON o.manager_id = e.id
+                WHERE o.id = ?
+            ''', (order_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            order = dict(zip((column[0] for column in cursor.description), row))
+            # Состав хранится в order_items, столбец products_list оставлен для совместимости
+            order.pop('products_list', None)
+            order['items'] = self.get_order_items(order_id)
+        except Exception as e:
+            self.log_error(f"Ошибка получения заявки: {e}")
+            return None
+        
+        with self.order_cache_lock:
+            if self.order_cache_stamp == stamp:
+                self.order_cache[order_id] = order
+                while len(self.order_cache) > self.ORDER_CACHE_SIZE:
+                    self.order_cache.popitem(last=False)
+        return dict(order)
+    
+    def get_order_items(self, order_id):
+        """Получение состава заявки"""
+        try:
+            cursor = self.get_connection().cursor()
+            cursor.execute('''
+                SELECT oi.product_id, p.name, p.article, oi.quantity, oi.price, oi.total
+                FROM order_items oi
+                LEFT JOIN products p ON p.id = oi.product_id
+                WHERE oi.order_id = ?
+                ORDER BY oi.id
+            ''', (order_id,))
+            return [
+                {'product_id': row[0], 'name': row[1], 'article': row[2],
+                 'quantity': row[3], 'price': row[4], 'total': row[5]}
+                for row in cursor.fetchall()
+            ]
+        except Exception as e:
+            self.log_error(f"Ошибка получения состава заявки: {e}")
+            return []
+    
+    def get_product_demand(self, limit=10):
+        """Спрос на продукцию по заявкам (без отмененных)"""
+        try:
+            cursor = self.get_connection().cursor()
+            cursor.execute('''
+                SELECT 
+                    p.name,
+                    p.product_type,
+                    SUM(oi.quantity) as total_ordered,
+                    SUM(oi.total) as total_revenue,
+                    COUNT(DISTINCT oi.order_id) as orders_count
+                FROM order_items oi
+                JOIN orders o ON o.id = oi.order_id
+                JOIN products p ON p.id = oi.product_id
+                WHERE o.status <> 'cancelled'
+                GROUP BY oi.product_id
+                ORDER BY total_ordered DESC
+                LIMIT ?
+            ''', (limit,))
+            return cursor.fetchall()
+        except Exception as e:
+            self.log_error(f"Ошибка получения спроса на продукцию: {e}")
+            return []
 
     def update_order_status(self, order_id, status, notes=None):
         """Обновление статуса заявки"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            update_fields = "status = ?"
-            params = [status]
-            
-            if status == 'prepayment_received':
-                update_fields += ", prepayment_received = TRUE, prepayment_date = ?"
-                params.append(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            elif status == 'in_production':
-                update_fields += ", production_date = ?"
-                params.append(datetime.now().strftime('%Y-%m-%d'))
-            elif status == 'ready':
-                update_fields += ", completion_date = ?"
-                params.append(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            elif status == 'completed':
-                update_fields += ", full_payment_received = TRUE, full_payment_date = ?, completion_date = ?"
-                params.extend([
-                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                ])
-            elif status == 'cancelled':
-                update_fields += ", prepayment_received = FALSE"
-            
-            if notes:
-                update_fields += ", notes = ?"
-                params.append(notes)
-            
-            params.append(order_id)
-            
-            cursor.execute(f'UPDATE orders SET {update_fields} WHERE id = ?', params)
-            conn.commit()
+            with self.transaction() as cursor:
+                update_fields = "status = ?"
+                params = [status]
+                
+                if status == 'prepayment_received':
+                    update_fields += ", prepayment_received = TRUE, prepayment_date = ?"
+                    params.append(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                elif status == 'in_production':
+                    update_fields += ", production_date = ?"
+                    params.append(datetime.now().strftime('%Y-%m-%d'))
+                elif status == 'ready':
+                    update_fields += ", completion_date = ?"
+                    params.append(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                elif status == 'completed':
+                    update_fields += ", full_payment_received = TRUE, full_payment_date = ?, completion_date = ?"
+                    params.extend([
+                        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    ])
+                elif status == 'cancelled':
+                    update_fields += ", prepayment_received = FALSE"
+                
+                if notes:
+                    update_fields += ", notes = ?"
+                    params.append(notes)
+                
+                params.append(order_id)
+                
+                cursor.execute(f'UPDATE orders SET {update_fields} WHERE id = ?', params)
             
             self.logger.info(f"Статус заявки #{order_id} изменен на '{status}'")
             return True
-            
+        
         except Exception as e:
-            self.logger.error(f"Ошибка обновления статуса заявки: {e}")
+            self.log_error(f"Ошибка обновления статуса заявки: {e}")
             return False
-        finally:
-            conn.close()
 
     def add_partner(self, partner_data):
         """Добавление нового партнера"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO partners 
-                (partner_type, company_name, legal_address, inn, director_name, email, phone, rating)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                partner_data['partner_type'],
-                partner_data['company_name'],
-                partner_data['legal_address'],
-                partner_data['inn'],
-                partner_data['director_name'],
-                partner_data['email'],
-                partner_data['phone'],
-                partner_data.get('rating', 5)
-            ))
+            with self.transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO partners 
+                    (partner_type, company_name, legal_address, inn, director_name, email, phone, rating)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    partner_data['partner_type'],
+                    partner_data['company_name'],
+                    partner_data['legal_address'],
+                    partner_data['inn'],
+                    partner_data['director_name'],
+                    partner_data['email'],
+                    partner_data['phone'],
+                    partner_data.get('rating', 5)
+                ))
+                
+                partner_id = cursor.lastrowid
             
-            partner_id = cursor.lastrowid
-            conn.commit()
             self.logger.info(f"Добавлен новый партнер: {partner_data['company_name']}")
             
             return partner_id
-            
+        
         except Exception as e:
-            self.logger.error(f"Ошибка добавления партнера: {e}")
+            self.log_error(f"Ошибка добавления партнера: {e}")
             return None
-        finally:
-            conn.close()
 
     def update_partner_rating(self, partner_id, new_rating, changed_by, reason=None):
         """Обновление рейтинга партнера"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Получаем текущий рейтинг
-            cursor.execute('SELECT rating FROM partners WHERE id = ?', (partner_id,))
-            old_rating = cursor.fetchone()[0]
-            
-            # Обновляем рейтинг
-            cursor.execute('UPDATE partners SET rating = ? WHERE id = ?', (new_rating, partner_id))
-            
-            # Добавляем запись в историю
-            cursor.execute('''
-                INSERT INTO partner_rating_history 
-                (partner_id, old_rating, new_rating, change_date, changed_by, reason)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                partner_id,
-                old_rating,
-                new_rating,
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                changed_by,
-                reason
-            ))
+            with self.transaction() as cursor:
+                # Получаем текущий рейтинг
+                cursor.execute('SELECT rating FROM partners WHERE id = ?', (partner_id,))
+                old_rating = cursor.fetchone()[0]
+                
+                # Обновляем рейтинг
+                cursor.execute('UPDATE partners SET rating = ? WHERE id = ?', (new_rating, partner_id))
+                
+                # Добавляем запись в историю
+                cursor.execute('''
+                    INSERT INTO partner_rating_history 
+                    (partner_id, old_rating, new_rating, change_date, changed_by, reason)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    partner_id,
+                    old_rating,
+                    new_rating,
+                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    changed_by,
+                    reason
+                ))
             
-            conn.commit()
             self.logger.info(f"Рейтинг партнера #{partner_id} изменен с {old_rating} на {new_rating}")
             
             return True
-            
+        
         except Exception as e:
-            self.logger.error(f"Ошибка обновления рейтинга: {e}")
+            self.log_error(f"Ошибка обновления рейтинга: {e}")
             return False
-        finally:
-            conn.close()
 
     def get_partner_sales_statistics(self, partner_id):
         """Получение статистики продаж для партнера"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            cursor = self.get_connection().cursor()
             
+            # Агрегаты поддерживаются триггерами на sales_history
             cursor.execute('''
                 SELECT 
                     p.company_name,
-                    SUM(sh.quantity) as total_quantity,
-                    SUM(sh.total_amount) as total_amount,
-                    COUNT(DISTINCT sh.product_id) as unique_products
-                FROM sales_history sh
-                JOIN partners p ON p.id = sh.partner_id
-                WHERE sh.partner_id = ?
-                GROUP BY p.company_name
+                    s.total_quantity,
+                    s.total_amount,
+                    s.unique_products
+                FROM partner_sales_summary s
+                JOIN partners p ON p.id = s.partner_id
+                WHERE s.partner_id = ?
             ''', (partner_id,))
             
             result = cursor.fetchone()
@@ -620,94 +1676,200 @@ class Database:
                 'total_amount': result[2] if result else 0,
                 'unique_products': result[3] if result else 0
             }
-            
+        
         except Exception as e:
-            self.logger.error(f"Ошибка получения статистики продаж: {e}")
+            self.log_error(f"Ошибка получения статистики продаж: {e}")
             return {}
-        finally:
-            conn.close()
+    
+    def get_partner_sales_report(self, partner_ids=None, company_name=None):
+        """Статистика продаж и скидки всех партнеров (или выбранных по id либо названию)
+        
+        Возвращает список словарей в порядке названий; None при ошибке чтения.
+        """
+        try:
+            query = '''
+                SELECT p.id, p.company_name, COALESCE(s.total_quantity, 0), COALESCE(s.unique_products, 0)
+                FROM partners p
+                LEFT JOIN partner_sales_summary s ON s.partner_id = p.id
+            '''
+            params = ()
+            if partner_ids is not None:
+                query += ' WHERE p.id IN (SELECT value FROM json_each(?))'
+                params = (json.dumps([int(partner_id) for partner_id in partner_ids]),)
+            elif company_name is not None:
+                query += ' WHERE p.company_name = ?'
+                params = (company_name,)
+            
+            cursor = self.get_connection().cursor()
+            cursor.execute(query + ' ORDER BY p.company_name', params)
+            rows = cursor.fetchall()
+        
+        except Exception as e:
+            self.log_error(f"Ошибка получения статистики продаж партнеров: {e}")
+            return None
+        
+        # Скидки всех выбранных партнеров считаются одним вызовом
+        discounts = self.get_partner_discounts(None if partner_ids is None and company_name is None
+                                               else [row[0] for row in rows])
+        if discounts is None:
+            return None
+        return [
+            dict(discounts.get(partner_id, {}), partner_id=partner_id, company_name=name,
+                 total_quantity=total_quantity, unique_products=unique_products)
+            for partner_id, name, total_quantity, unique_products in rows
+        ]
     
     def calculate_partner_discount(self, partner_id):
         """Расчет скидки для партнера на основе истории продаж"""
         try:
-            stats = self.get_partner_sales_statistics(partner_id)
-            total_amount = stats.get('total_amount', 0)
-            
-            # Логика расчета скидки на основе общего объема продаж
-            if total_amount > 10000000:  # более 10 млн
-                discount = 0.15  # 15%
-            elif total_amount > 5000000:  # более 5 млн
-                discount = 0.10  # 10%
-            elif total_amount > 1000000:  # более 1 млн
-                discount = 0.05  # 5%
-            else:
-                discount = 0.02  # 2%
-            
-            return discount
+            cursor = self.get_connection().cursor()
+            cursor.execute('SELECT total_amount FROM partner_sales_summary WHERE partner_id = ?', (partner_id,))
+            result = cursor.fetchone()
+            total_amount = result[0] if result else 0
             
+            discounts, _, _ = calculate_discounts([total_amount])
+            return float(discounts[0])
+        
         except Exception as e:
-            self.logger.error(f"Ошибка расчета скидки: {e}")
+            self.log_error(f"Ошибка расчета скидки: {e}")
             return 0.0
+    
+    def get_partner_discounts(self, partner_ids=None):
+        """Скидки и следующий уровень для всех партнеров (или для partner_ids) за один запрос (None при ошибке)"""
+        import numpy as np
+        try:
+            query = '''
+                SELECT p.id, COALESCE(s.total_amount, 0)
+                FROM partners p
+                LEFT JOIN partner_sales_summary s ON s.partner_id = p.id
+            '''
+            params = ()
+            if partner_ids is not None:
+                # Список id передается одним параметром, без ограничения на число "?"
+                query += ' WHERE p.id IN (SELECT value FROM json_each(?))'
+                params = (json.dumps([int(partner_id) for partner_id in partner_ids]),)
+            
+            cursor = self.get_connection().cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            ids = [row[0] for row in rows]
+            amounts = np.array([row[1] for row in rows], dtype='float64')
+            discounts, next_discounts, next_thresholds = calculate_discounts(amounts)
+            remaining = np.maximum(next_thresholds - amounts, 0)
+            
+            return {
+                partner_id: {
+                    'total_amount': float(amount),
+                    'discount': float(discount),
+                    'next_discount': None if np.isnan(next_discount) else float(next_discount),
+                    'next_threshold': None if np.isnan(threshold) else float(threshold),
+                    'remaining': None if np.isnan(rest) else float(rest)
+                }
+                for partner_id, amount, discount, next_discount, threshold, rest
+                in zip(ids, amounts, discounts, next_discounts, next_thresholds, remaining)
+            }
+        
+        except Exception as e:
+            self.log_error(f"Ошибка расчета скидок партнеров: {e}")
+            return None
 
     def get_top_products(self, limit=10):
-        """Получение топовых продуктов по продажам"""
+        """Получение топовых продуктов по продажам (None при ошибке)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            cursor = self.get_connection().cursor()
             
+            # Сначала агрегируем продажи по покрывающему индексу, затем присоединяем продукты по id
             cursor.execute('''
                 SELECT 
                     p.name,
                     p.product_type,
-                    SUM(sh.quantity) as total_sold,
-                    SUM(sh.total_amount) as total_revenue
-                FROM sales_history sh
+                    sh.total_sold,
+                    sh.total_revenue
+                FROM (
+                    SELECT product_id,
+                           SUM(quantity) as total_sold,
+                           SUM(total_amount) as total_revenue
+                    FROM sales_history
+                    GROUP BY product_id
+                ) sh
                 JOIN products p ON p.id = sh.product_id
-                GROUP BY p.id
-                ORDER BY total_sold DESC
+                ORDER BY sh.total_sold DESC
                 LIMIT ?
             ''', (limit,))
             
             return cursor.fetchall()
-            
+        
         except Exception as e:
-            self.logger.error(f"Ошибка получения топовых продуктов: {e}")
-            return []
-        finally:
-            conn.close()
-
-    def check_expired_orders(self):
-        """Проверка заявок с истекшим сроком предоплаты"""
+            self.log_error(f"Ошибка получения топовых продуктов: {e}")
+            return None
+    
+    def sweep_expired_orders(self):
+        """Отмена заявок с истекшим сроком предоплаты одним запросом, возвращает их id (None при ошибке)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            three_days_ago = (datetime.now() - timedelta(days=3)).strftime('%Y-%m-%d %H:%M:%S')
-            
-            cursor.execute('''
-                SELECT id, partner_id 
-                FROM orders 
-                WHERE status = 'created' 
-                AND prepayment_received = FALSE
-                AND order_date < ?
-            ''', (three_days_ago,))
-            
-            expired_orders = cursor.fetchall()
-            
-            for order in expired_orders:
-                cursor.execute('''
-                    UPDATE orders 
-                    SET status = 'cancelled', notes = 'Автоматическая отмена: не поступила предоплата в течение 3 дней'
-                    WHERE id = ?
-                ''', (order[0],))
-            
-            conn.commit()
-            self.logger.info(f"Автоматически отменено {len(expired_orders)} заявок")
-            
-            return len(expired_orders)
-            
+            deadline = (datetime.now() - timedelta(days=self.PREPAYMENT_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+            notes = f'Автоматическая отмена: не поступила предоплата в течение {self.PREPAYMENT_DAYS} дней'
+            with self.transaction() as cursor:
+                if self.SUPPORTS_RETURNING:
+                    cursor.execute(self.EXPIRED_ORDERS_SQL, (notes, deadline))
+                    expired_ids = sorted(row[0] for row in cursor.fetchall())
+                else:
+                    # BEGIN IMMEDIATE не дает другим соединениям изменить заявки между запросами
+                    cursor.execute(self.EXPIRED_ORDERS_SELECT_SQL, (deadline,))
+                    expired_ids = sorted(row[0] for row in cursor.fetchall())
+                    cursor.execute(self.EXPIRED_ORDERS_UPDATE_SQL, (notes, deadline))
+            
+            if expired_ids:
+                self.logger.info(f"Автоматически отменено {len(expired_ids)} заявок")
+            return expired_ids
+        
         except Exception as e:
-            self.logger.error(f"Ошибка проверки просроченных заявок: {e}")
-            return 0
-        finally:
-            conn.close()
\ No newline at end of file
+            self.log_error(f"Ошибка проверки просроченных заявок: {e}")
+            return None
+
+    def check_expired_orders(self):
+        """Проверка заявок с истекшим сроком предоплаты: число отмененных (None при ошибке)"""
+        expired_ids = self.sweep_expired_orders()
+        return None if expired_ids is None else len(expired_ids)
+    
+    def start_expiry_scheduler(self, interval=None, on_expired=None):
+        """Запуск фоновой проверки просроченных заявок с заданным периодом (секунды)"""
+        if self.expiry_thread is not None:
+            return False
+        interval = interval or self.EXPIRY_SWEEP_INTERVAL
+        # У каждого запуска свое событие: прежний поток, остановленный без ожидания,
+        # завершит начатую проверку сам, и новый запуск его не ждет
+        stop = self.expiry_stop = threading.Event()
+        
+        def run():
+            # Первая проверка сразу, затем раз в interval секунд до остановки
+            while not stop.is_set():
+                expired_ids = self.sweep_expired_orders()
+                if expired_ids and on_expired is not None:
+                    try:
+                        on_expired(expired_ids)
+                    except Exception as e:
+                        self.log_error(f"Ошибка обработки отмененных заявок: {e}")
+                stop.wait(interval)
+            # Соединение потока больше не нужно: новый запуск откроет свое
+            self.release_connection()
+        
+        self.expiry_thread = threading.Thread(target=run, name='expiry-sweep', daemon=True)
+        self.expiry_thread.start()
+        self.logger.info(f"Запущена фоновая проверка просроченных заявок (каждые {interval} с)")
+        return True
+    
+    def stop_expiry_scheduler(self, timeout=5):
+        """Остановка фоновой проверки просроченных заявок
+        
+        Поток, не завершившийся за timeout, доделывает начатую проверку сам;
+        close() дожидается его перед закрытием соединений.
+        """
+        if self.expiry_thread is None:
+            return
+        self.expiry_stop.set()
+        self.logger.info("Фоновая проверка просроченных заявок остановлена")
+        self.expiry_thread.join(timeout)
+        self.stopped_expiry_threads = [thread for thread in self.stopped_expiry_threads if thread.is_alive()]
+        if self.expiry_thread.is_alive():
+            self.stopped_expiry_threads.append(self.expiry_thread)
+        self.expiry_thread = None
@@ -1,18 +1,446 @@
+import time
+# Отсчет времени до появления окна
+STARTED = time.perf_counter()
+import argparse
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import logging
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import json
-from database import Database
+from database import Database, DISCOUNT_TIERS
+from query_stats import add_stats_arguments, start_stats
+
+class BackgroundTask:
+    """Фоновая операция: описание, флаг отмены и последний отчет о ходе"""
+    def __init__(self, description, key=None, cancellable=False):
+        self.description = description
+        self.key = key
+        self.cancellable = cancellable
+        self.cancel_event = threading.Event()
+        self.progress_text = ""
+    
+    def cancel(self):
+        self.cancel_event.set()
+
+class TaskRunner:
+    """Выполнение операций с базой в фоновых потоках с доставкой результата в поток Tk"""
+    POLL_INTERVAL_MS = 50
+    
+    def __init__(self, root, status_var, max_workers=2):
+        self.root = root
+        self.status_var = status_var
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gui-task')
+        # Записи и импорт идут по очереди в одном потоке, как в AsyncDatabase: запись, поданная
+        # во время импорта, ждет его в очереди, а не блокировку базы, и не занимает потоки чтения
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gui-write')
+        # Результаты и отчеты о ходе из рабочих потоков, разбираются в poll()
+        self.events = queue.Queue()
+        self.active = []
+        self.latest = {}
+        self.poll_job = None
+        self.on_change = None
+    
+    def submit(self, description, func, on_done=None, on_error=None, key=None, cancellable=False, write=False):
+        """Запуск func(task) в рабочем потоке; on_done(result) вызывается в потоке Tk
+        
+        write=True - операция изменяет данные и выполняется в очереди записи.
+        """
+        task = BackgroundTask(description, key, cancellable)
+        if key is not None:
+            # Более новая задача с тем же ключом делает результат прежней ненужным
+            previous = self.latest.get(key)
+            if previous is not None:
+                previous.cancel()
+            self.latest[key] = task
+        self.active.append(task)
+        self.update_status()
+        
+        def run():
+            try:
+                self.events.put(('done', task, func(task), on_done, on_error))
+            except Exception as e:
+                self.events.put(('error', task, e, on_done, on_error))
+        
+        (self.writer if write else self.executor).submit(run)
+        if self.poll_job is None:
+            self.poll_job = self.root.after(self.POLL_INTERVAL_MS, self.poll)
+        return task
+    
+    def report(self, task, text):
+        """Отчет о ходе задачи (вызывается из рабочего потока)"""
+        self.events.put(('progress', task, text, None, None))
+    
+    def poll(self):
+        """Разбор накопившихся событий рабочих потоков"""
+        self.poll_job = None
+        while True:
+            try:
+                kind, task, value, on_done, on_error = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                task.progress_text = value
+                continue
+            
+            self.active.remove(task)
+            if task.key is not None:
+                # Результат задачи, замененной более новой, не показывается
+                if self.latest.get(task.key) is not task:
+                    continue
+                del self.latest[task.key]
+            try:
+                if kind == 'done' and on_done is not None:
+                    on_done(value)
+                elif kind == 'error':
+                    if on_error is not None:
+                        on_error(value)
+                    else:
+                        messagebox.showerror("Ошибка", f"{task.description}: {value}")
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Ошибка обработки результата '{task.description}': {e}")
+        
+        self.update_status()
+        if self.active:
+            self.poll_job = self.root.after(self.POLL_INTERVAL_MS, self.poll)
+    
+    def update_status(self):
+        """Отображение выполняющихся задач в строке состояния"""
+        if not self.active:
+            self.status_var.set("Готов к работе")
+        else:
+            task = self.active[0]
+            text = f"⏳ {task.description}"
+            if task.progress_text:
+                text += f": {task.progress_text}"
+            if len(self.active) > 1:
+                text += f" (еще задач: {len(self.active) - 1})"
+            self.status_var.set(text)
+        if self.on_change is not None:
+            self.on_change(any(task.cancellable for task in self.active))
+    
+    def cancel_all(self):
+        """Запрос отмены всех прерываемых задач"""
+        for task in self.active:
+            if task.cancellable:
+                task.cancel()
+    
+    def shutdown(self):
+        """Отмена задач и остановка рабочих потоков"""
+        for task in self.active:
+            task.cancel()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.writer.shutdown(wait=True, cancel_futures=True)
+
+class LogSink(logging.Handler):
+    """Журнал операций в текстовом поле: сообщения из любых потоков выводятся пачками"""
+    DRAIN_INTERVAL_MS = 100
+    MAX_LINES = 2000
+    
+    def __init__(self, widget, level=logging.INFO):
+        super().__init__(level)
+        self.widget = widget
+        self.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%H:%M:%S'))
+        # Строки журнала от вызывающих потоков, разбираются в drain() в потоке Tk
+        self.lines = queue.Queue()
+        self.drain_job = self.widget.after(self.DRAIN_INTERVAL_MS, self.drain)
+    
+    def write(self, message):
+        """Добавление сообщения; можно вызывать из любого потока"""
+        self.lines.put(message)
+    
+    def emit(self, record):
+        try:
+            self.lines.put(self.format(record))
+        except Exception:
+            self.handleError(record)
+    
+    def flush(self):
+        """Ничего не делает: logging вызывает flush() сам, в том числе после закрытия окна"""
+    
+    def drain(self):
+        """Вывод накопившихся строк одной вставкой и обрезка журнала до MAX_LINES"""
+        lines = []
+        while True:
+            try:
+                lines.append(self.lines.get_nowait())
+            except queue.Empty:
+                break
+        if lines:
+            # Из большой пачки выводятся только строки, которые останутся в журнале
+            lines = lines[-self.MAX_LINES:]
+            self.widget.insert(tk.END, '\n'.join(lines) + '\n')
+            excess = int(self.widget.index('end-1c').split('.')[0]) - 1 - self.MAX_LINES
+            if excess > 0:
+                self.widget.delete('1.0', f'{excess + 1}.0')
+            self.widget.see(tk.END)
+        self.drain_job = self.widget.after(self.DRAIN_INTERVAL_MS, self.drain)
+    
+    def close(self):
+        if self.drain_job is not None:
+            self.widget.after_cancel(self.drain_job)
+            self.drain_job = None
+        super().close()
+
+def sync_tree(tree, rows):
+    """Приведение строк Treeview к списку (id, значения): меняются только отличающиеся строки.
+    
+    Оставшиеся строки не пересоздаются, поэтому выделение и прокрутка сохраняются.
+    """
+    new_iids = []
+    wanted = set()
+    for iid, values in rows:
+        iid = str(iid)
+        if iid in wanted:
+            # Повтор id (например, одинаковые названия) получает номер позиции
+            iid = f'{iid}-{len(new_iids)}'
+        new_iids.append(iid)
+        wanted.add(iid)
+    
+    stale = [iid for iid in tree.get_children() if iid not in wanted]
+    if stale:
+        tree.delete(*stale)
+    
+    current = list(tree.get_children())
+    for index, (iid, (_, values)) in enumerate(zip(new_iids, rows)):
+        values = tuple(values)
+        if not tree.exists(iid):
+            tree.insert('', index, iid=iid, values=values)
+            current.insert(index, iid)
+            continue
+        # Treeview возвращает значения строками, поэтому сравниваются строковые представления
+        if tuple(tree.item(iid, 'values')) != tuple(str(value) for value in values):
+            tree.item(iid, values=values)
+        if current[index] != iid:
+            tree.move(iid, '', index)
+            current.remove(iid)
+            current.insert(index, iid)
+
+class VirtualTreeview:
+    """Виртуальный список на ttk.Treeview: в виджете только видимые строки и запас вокруг них"""
+    OVERSCAN = 20       # строк сверх видимых сверху и снизу
+    BLOCK_SIZE = 200    # строк в одном запросе к базе
+    MAX_BLOCKS = 16     # блоков в памяти
+    
+    def __init__(self, parent, name, columns, column_widths, tasks, format_row=tuple, height=15):
+        self.name = name
+        self.tasks = tasks
+        self.format_row = format_row
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=columns, show='headings', height=height)
+        for i, col in enumerate(columns):
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=column_widths[i])
+        
+        # Полоса прокрутки показывает положение во всей таблице, а не в отрисованных строках
+        self.scrollbar = ttk.Scrollbar(self.frame, orient='vertical', command=self.on_scrollbar)
+        self.tree.configure(yscrollcommand=self.on_tree_scrolled)
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.scrollbar.pack(side='right', fill='y')
+        self.tree.bind('<Configure>', lambda event: self.schedule_render())
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(sequence, self.on_mousewheel)
+        
+        self.source = None
+        self.generation = 0
+        self.total = 0
+        self.first = 0
+        self.window = (0, 0)
+        # Номер блока -> (строки, ключ последней строки для выборки следующего блока)
+        self.blocks = OrderedDict()
+        # Блоки, перечитанные после последнего обновления; остальные показываются до замены
+        self.fresh = set()
+        self.pending = set()
+        # Блоки текущего окна; читается рабочими потоками перед запросом блока
+        self.wanted = range(0)
+        self.render_job = None
+    
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+    
+    def is_loaded(self, iid):
+        """Строка уже загружена, а не временная заглушка"""
+        return not iid.startswith('loading-')
+    
+    def set_source(self, count_func, page_func):
+        """Источник строк: count_func() -> число строк, page_func(offset, limit, cursor) -> (строки, курсор)"""
+        self.source = (count_func, page_func)
+        self.refresh()
+    
+    def refresh(self):
+        """Перечитывание числа строк и видимых блоков после изменения данных"""
+        self.generation += 1
+        generation = self.generation
+        count_func = self.source[0]
+        self.tasks.submit("Загрузка списка", lambda task: count_func(),
+                          lambda total: self.on_count(total, generation), key=f'{self.name}:count')
+    
+    def on_count(self, total, generation):
+        if generation != self.generation:
+            return
+        # Старые блоки остаются на экране, пока не придут новые, и при обновлении
+        # перерисовываются только изменившиеся строки
+        self.fresh.clear()
+        self.pending.clear()
+        self.total = total
+        self.first = max(0, min(self.first, total - self.visible_rows()))
+        self.render()
+    
+    def visible_rows(self):
+        """Число строк, помещающихся в видимой области"""
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        height = self.tree.winfo_height()
+        if height <= 1:
+            return int(self.tree.cget('height'))
+        # Без строки заголовков
+        return max(1, height // row_height - 1)
+    
+    def schedule_render(self):
+        if self.render_job is None:
+            self.render_job = self.tree.after_idle(self.render)
+    
+    def render(self):
+        """Отрисовка окна строк вокруг первой видимой и загрузка недостающих блоков"""
+        if self.render_job is not None:
+            self.tree.after_cancel(self.render_job)
+            self.render_job = None
+        visible = self.visible_rows()
+        start = max(0, self.first - self.OVERSCAN)
+        end = min(self.total, self.first + visible + self.OVERSCAN)
+        self.wanted = range(start // self.BLOCK_SIZE, (end - 1) // self.BLOCK_SIZE + 1)
+        
+        rows = []
+        for position in range(start, end):
+            block, index = divmod(position, self.BLOCK_SIZE)
+            if block not in self.fresh:
+                self.load_block(block)
+            data = self.blocks.get(block)
+            if data is None or index >= len(data[0]):
+                # Блок еще загружается
+                rows.append((f'loading-{position}', ('…',)))
+            else:
+                self.blocks.move_to_end(block)
+                values = self.format_row(data[0][index])
+                rows.append((values[0], values))
+        
+        sync_tree(self.tree, rows)
+        
+        self.window = (start, end)
+        self.tree.yview_moveto(0)
+        self.tree.yview_scroll(self.first - start, 'units')
+        self.update_scrollbar()
+    
+    def load_block(self, block):
+        """Фоновая загрузка блока строк"""
+        if block in self.pending:
+            return
+        self.pending.add(block)
+        generation = self.generation
+        page_func = self.source[1]
+        # Если предыдущий блок уже перечитан, следующий выбирается по его последнему ключу
+        previous = self.blocks.get(block - 1) if block - 1 in self.fresh else None
+        cursor = previous[1] if previous is not None else None
+        offset = block * self.BLOCK_SIZE
+        
+        def fetch(task):
+            # При перетаскивании полосы прокрутки блоки, пройденные по пути, успевают
+            # уйти из окна, пока ждут в очереди: их запросы пропускаются
+            if generation != self.generation or block not in self.wanted:
+                return None
+            return page_func(offset, self.BLOCK_SIZE, cursor)
+        
+        self.tasks.submit("Загрузка строк", fetch, lambda result: self.on_block(block, result, generation),
+                          key=f'{self.name}:{generation}:{block}')
+    
+    def on_block(self, block, result, generation):
+        if generation != self.generation:
+            return
+        self.pending.discard(block)
+        if result is None:
+            # Блок пропущен; если окно снова до него дойдет, render() запросит его заново
+            if block in self.wanted:
+                self.schedule_render()
+            return
+        self.fresh.add(block)
+        self.blocks[block] = result
+        self.blocks.move_to_end(block)
+        while len(self.blocks) > self.MAX_BLOCKS:
+            evicted, _ = self.blocks.popitem(last=False)
+            self.fresh.discard(evicted)
+        self.schedule_render()
+    
+    def update_scrollbar(self):
+        if self.total == 0:
+            self.scrollbar.set(0, 1)
+            return
+        self.scrollbar.set(self.first / self.total,
+                           min(1, (self.first + self.visible_rows()) / self.total))
+    
+    def scroll_to(self, first):
+        first = max(0, min(first, self.total - self.visible_rows()))
+        if first != self.first:
+            self.first = first
+            self.render()
+    
+    def on_scrollbar(self, action, value, unit=None):
+        """Перемещение полосы прокрутки: переход к позиции во всей таблице"""
+        if action == 'moveto':
+            self.scroll_to(int(float(value) * self.total))
+        elif action == 'scroll':
+            step = self.visible_rows() if unit == 'pages' else 1
+            self.scroll_to(self.first + int(value) * step)
+    
+    def on_mousewheel(self, event):
+        delta = -3 if event.num == 4 or event.delta > 0 else 3
+        self.scroll_to(self.first + delta)
+        return 'break'
+    
+    def on_tree_scrolled(self, low, high):
+        """Прокрутка внутри отрисованных строк (клавиши, see()): сдвиг окна"""
+        start, end = self.window
+        if end <= start:
+            return
+        first = start + round(float(low) * (end - start))
+        if first == self.first:
+            return
+        self.first = first
+        self.update_scrollbar()
+        # Окно перестраивается, когда до его края остается меньше половины запаса
+        margin = self.OVERSCAN // 2
+        if ((start > 0 and first - start < margin)
+                or (end < self.total and end - first - self.visible_rows() < margin)):
+            self.schedule_render()
 
 class MasterPolGUI:
-    def __init__(self, root):
+    SEARCH_DELAY_MS = 300       # пауза в наборе перед запросом поиска
+    SEARCH_CACHE_SIZE = 64      # запомненных результатов поиска
+    
+    def __init__(self, root, db=None):
         self.root = root
-        self.db = Database()
+        self.db = db or Database()
         self.current_order_items = []
+        # Поиск по мере ввода: отложенный запуск и результаты по строке поиска -> (отметка данных, строки)
+        self.search_job = None
+        self.partner_search_term = None
+        self.search_cache = OrderedDict()
+        # id заявок, отмененных фоновой проверкой, передаются в главный поток через очередь
+        self.expired_queue = queue.Queue()
+        self.expiry_poll_job = None
         self.setup_logging()
         self.setup_gui()
         self.import_initial_data()
+        self.root.bind('<Map>', self.on_first_map, add='+')
+    
+    def on_first_map(self, event):
+        """Замер времени от запуска до появления окна"""
+        if event.widget is not self.root:
+            return
+        self.root.unbind('<Map>')
+        elapsed = time.perf_counter() - STARTED
+        self.logger.info(f"Окно открыто через {elapsed:.2f} с после запуска")
+        self.log_message(f"Окно открыто через {elapsed:.2f} с после запуска")
     
     def setup_logging(self):
         logging.basicConfig(
@@ -26,6 +454,10 @@ class MasterPolGUI:
         self.root.title("Система 'Мастер пол' - Управление производством")
         self.root.geometry("1400x800")
         
+        # Строка состояния нужна до создания вкладок: они загружают данные в фоне
+        self.status_var = tk.StringVar(value="Готов к работе")
+        self.tasks = TaskRunner(self.root, self.status_var)
+        
         # Создание вкладок
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
@@ -60,10 +492,28 @@ class MasterPolGUI:
         self.notebook.add(self.import_frame, text="📥 Импорт данных")
         self.setup_import_tab()
         
+        # Данные вкладки загружаются при ее первом показе: вкладка -> загрузка данных
+        self.tab_loaders = {
+            str(self.partners_frame): lambda: self.update_partners_list(self.partner_search_var.get()),
+            str(self.products_frame): self.update_products_list,
+            str(self.orders_frame): self.update_order_form_data,
+            str(self.manage_orders_frame): self.update_orders_list,
+            str(self.stats_frame): self.update_stats_data,
+        }
+        self.loaded_tabs = set()
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        # Первая вкладка уже выбрана, событие для нее могло прийти до привязки
+        self.root.after_idle(self.on_tab_changed)
+        
         # Статус бар
-        self.status_var = tk.StringVar(value="Готов к работе")
-        status_bar = ttk.Label(self.root, textvariable=self.status_var, relief='sunken', anchor='w')
-        status_bar.pack(side='bottom', fill='x')
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side='bottom', fill='x')
+        self.cancel_button = ttk.Button(status_frame, text="Отмена", state='disabled',
+                                        command=self.tasks.cancel_all)
+        self.cancel_button.pack(side='right')
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, relief='sunken', anchor='w')
+        status_bar.pack(side='left', fill='x', expand=True)
+        self.tasks.on_change = self.on_tasks_changed
     
     def setup_partners_tab(self):
         """Настройка вкладки партнеров"""
@@ -86,18 +536,11 @@ class MasterPolGUI:
         
         # Таблица партнеров
         columns = ('ID', 'Тип', 'Компания', 'Директор', 'Email', 'Телефон', 'Рейтинг', 'ИНН')
-        self.partners_tree = ttk.Treeview(self.partners_frame, columns=columns, show='headings', height=15)
-        
         column_widths = [50, 80, 200, 150, 150, 120, 80, 120]
-        for i, col in enumerate(columns):
-            self.partners_tree.heading(col, text=col)
-            self.partners_tree.column(col, width=column_widths[i])
-        
-        scrollbar = ttk.Scrollbar(self.partners_frame, orient='vertical', command=self.partners_tree.yview)
-        self.partners_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.partners_tree.pack(side='left', fill='both', expand=True, padx=5, pady=5)
-        scrollbar.pack(side='right', fill='y', padx=5, pady=5)
+        self.partners_list = VirtualTreeview(self.partners_frame, 'partners', columns, column_widths,
+                                             self.tasks, self.format_partner_row, height=15)
+        self.partners_tree = self.partners_list.tree
+        self.partners_list.pack(side='left', fill='both', expand=True, padx=5, pady=5)
         
         # Панель деталей
         details_frame = ttk.LabelFrame(self.partners_frame, text="Детали партнера")
@@ -106,29 +549,17 @@ class MasterPolGUI:
         self.partner_info_text = scrolledtext.ScrolledText(details_frame, height=8, wrap=tk.WORD)
         self.partner_info_text.pack(fill='both', expand=True, padx=5, pady=5)
         
-        # Обновление данных
-        self.update_partners_list()
         self.partners_tree.bind('<<TreeviewSelect>>', self.on_partner_select)
     
     def setup_products_tab(self):
         """Настройка вкладки продукции"""
         # Таблица продукции
         columns = ('ID', 'Тип', 'Наименование', 'Артикул', 'Цена', 'На складе')
-        self.products_tree = ttk.Treeview(self.products_frame, columns=columns, show='headings', height=20)
-        
         column_widths = [50, 100, 300, 100, 100, 80]
-        for i, col in enumerate(columns):
-            self.products_tree.heading(col, text=col)
-            self.products_tree.column(col, width=column_widths[i])
-        
-        scrollbar = ttk.Scrollbar(self.products_frame, orient='vertical', command=self.products_tree.yview)
-        self.products_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.products_tree.pack(side='left', fill='both', expand=True, padx=5, pady=5)
-        scrollbar.pack(side='right', fill='y', padx=5, pady=5)
-        
-        # Обновление данных
-        self.update_products_list()
+        self.products_list = VirtualTreeview(self.products_frame, 'products', columns, column_widths,
+                                             self.tasks, self.format_product_row, height=20)
+        self.products_tree = self.products_list.tree
+        self.products_list.pack(side='left', fill='both', expand=True, padx=5, pady=5)
     
     def setup_orders_tab(self):
         """Настройка вкладки создания заявок"""
@@ -235,9 +666,6 @@ class MasterPolGUI:
         # Кнопка создания заявки
         ttk.Button(right_frame, text="Создать заявку", 
                   command=self.create_order).pack(pady=10)
-        
-        # Обновление данных
-        self.update_order_form_data()
     
     def setup_manage_orders_tab(self):
         """Настройка вкладки управления заявками"""
@@ -257,21 +685,18 @@ class MasterPolGUI:
                   command=self.update_orders_list).pack(side='left', padx=20)
         ttk.Button(filter_frame, text="Проверить просроченные", 
                   command=self.check_expired_orders).pack(side='left', padx=5)
+        self.auto_expiry_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(filter_frame, text="Проверять автоматически",
+                       variable=self.auto_expiry_var,
+                       command=self.toggle_expiry_scheduler).pack(side='left', padx=5)
         
         # Таблица заявок
         columns = ('ID', 'Дата', 'Партнер', 'Менеджер', 'Сумма', 'Статус', 'Доставка')
-        self.orders_manage_tree = ttk.Treeview(self.manage_orders_frame, columns=columns, show='headings', height=15)
-        
         column_widths = [50, 120, 200, 150, 100, 120, 100]
-        for i, col in enumerate(columns):
-            self.orders_manage_tree.heading(col, text=col)
-            self.orders_manage_tree.column(col, width=column_widths[i])
-        
-        scrollbar = ttk.Scrollbar(self.manage_orders_frame, orient='vertical', command=self.orders_manage_tree.yview)
-        self.orders_manage_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.orders_manage_tree.pack(side='left', fill='both', expand=True, padx=5, pady=5)
-        scrollbar.pack(side='right', fill='y', padx=5, pady=5)
+        self.orders_list = VirtualTreeview(self.manage_orders_frame, 'orders', columns, column_widths,
+                                           self.tasks, self.format_order_row, height=15)
+        self.orders_manage_tree = self.orders_list.tree
+        self.orders_list.pack(side='left', fill='both', expand=True, padx=5, pady=5)
         
         # Панель управления статусом
         status_control_frame = ttk.LabelFrame(self.manage_orders_frame, text="Управление статусом заявки")
@@ -298,8 +723,6 @@ class MasterPolGUI:
         self.order_details_text = scrolledtext.ScrolledText(details_frame, height=8, wrap=tk.WORD)
         self.order_details_text.pack(fill='both', expand=True, padx=5, pady=5)
         
-        # Обновление данных
-        self.update_orders_list()
         self.orders_manage_tree.bind('<<TreeviewSelect>>', self.on_order_select)
     
     def setup_stats_tab(self):
@@ -348,9 +771,6 @@ class MasterPolGUI:
         
         self.top_products_tree.pack(side='left', fill='both', expand=True, padx=5, pady=5)
         scrollbar.pack(side='right', fill='y', padx=5, pady=5)
-        
-        # Обновление данных
-        self.update_stats_data()
     
     def setup_import_tab(self):
         """Настройка вкладки импорта данных"""
@@ -374,7 +794,7 @@ class MasterPolGUI:
                   command=lambda: self.import_data('partners')).pack(fill='x', pady=2)
         
         ttk.Button(button_frame, text="Импорт истории продаж", 
-                  command=lambda: self.import_data('sales')).pack(fill='x', pady=2)
+                  command=lambda: self.import_data('sales_history')).pack(fill='x', pady=2)
         
         ttk.Button(button_frame, text="Импорт всех данных", 
                   command=self.import_all_data).pack(fill='x', pady=10)
@@ -385,70 +805,158 @@ class MasterPolGUI:
         
         self.import_log = scrolledtext.ScrolledText(log_frame, height=20, wrap=tk.WORD)
         self.import_log.pack(fill='both', expand=True, padx=5, pady=5)
+        # Сообщения интерфейса и записи журнала базы данных выводятся пачками
+        self.log_sink = LogSink(self.import_log)
+        logging.getLogger('database').addHandler(self.log_sink)
     
     # ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ
     
+    def on_tab_changed(self, event=None):
+        """Загрузка данных вкладки при первом показе"""
+        tab = self.notebook.select()
+        if tab in self.tab_loaders and tab not in self.loaded_tabs:
+            self.loaded_tabs.add(tab)
+            self.tab_loaders[tab]()
+    
+    def refresh_tab(self, frame):
+        """Обновление данных вкладки, если она уже загружена; иначе они загрузятся при показе"""
+        if str(frame) in self.loaded_tabs:
+            self.tab_loaders[str(frame)]()
+    
+    def on_tasks_changed(self, cancellable):
+        """Кнопка отмены доступна, пока выполняется прерываемая задача"""
+        self.cancel_button.configure(state='normal' if cancellable else 'disabled')
+    
+    def page_source(self, source, status=None):
+        """Функции подсчета и постраничной загрузки строк для VirtualTreeview"""
+        return (
+            lambda: self.db.count_rows(source, status),
+            lambda offset, limit, cursor: self.db.get_page_at(source, offset, limit, status, cursor)
+        )
+    
+    def search_source(self, term, result):
+        """Функции подсчета и постраничной загрузки результатов поиска партнеров
+        
+        Число совпадений и первый блок из result используются, пока данные не менялись.
+        """
+        stamp, total, first_rows = result
+        
+        def count():
+            return total if self.db.get_data_stamp() == stamp else self.db.count_partner_matches(term)
+        
+        def page(offset, limit, cursor):
+            if offset == 0 and limit <= self.partners_list.BLOCK_SIZE and self.db.get_data_stamp() == stamp:
+                return first_rows[:limit], None
+            return self.db.search_partners(term, limit, offset), None
+        
+        return count, page
+    
     def update_partners_list(self, search_term=""):
         """Обновление списка партнеров"""
-        for item in self.partners_tree.get_children():
-            self.partners_tree.delete(item)
-        
-        partners = self.db.get_all_partners()
-        for partner in partners:
-            if search_term.lower() in partner[2].lower():  # Поиск по названию компании
-                self.partners_tree.insert('', 'end', values=partner)
+        term = ' '.join(search_term.split())
+        self.partner_search_term = term
+        cached = self.search_cache.get(term)
+        
+        def fetch(task):
+            if not term:
+                return None
+            # Запомненный результат годится, пока данные не менялись
+            stamp = self.db.get_data_stamp()
+            if cached is not None and cached[0] == stamp:
+                return cached
+            # Задача уже заменена более новым запросом
+            if task.cancel_event.is_set():
+                return None
+            # Поиск выполняется полнотекстовым индексом в базе; запоминаются число
+            # совпадений и первый блок, остальные блоки список читает при прокрутке
+            return (stamp, self.db.count_partner_matches(term),
+                    self.db.search_partners(term, self.partners_list.BLOCK_SIZE))
+        
+        def done(result):
+            if result is None:
+                self.partners_list.set_source(*self.page_source('partners'))
+                return
+            self.search_cache[term] = result
+            self.search_cache.move_to_end(term)
+            while len(self.search_cache) > self.SEARCH_CACHE_SIZE:
+                self.search_cache.popitem(last=False)
+            self.partners_list.set_source(*self.search_source(term, result))
+        
+        # Новая задача с тем же ключом отменяет предыдущую, ее результат отбрасывается
+        self.tasks.submit("Загрузка партнеров", fetch, done, key='partners')
+    
+    def format_partner_row(self, partner):
+        """Значения столбцов списка партнеров из строки таблицы partners"""
+        # id, тип, компания, директор, email, телефон, рейтинг, ИНН
+        return (partner[0], partner[1], partner[2], partner[5], partner[6], partner[7], partner[9], partner[4])
     
     def update_products_list(self):
         """Обновление списка продукции"""
-        for item in self.products_tree.get_children():
-            self.products_tree.delete(item)
-        
-        products = self.db.get_all_products()
-        for product in products:
-            # Добавляем случайное количество на складе для демонстрации
-            import random
-            stock = random.randint(0, 1000)
-            product_with_stock = product + (stock,)
-            self.products_tree.insert('', 'end', values=product_with_stock)
+        self.products_list.set_source(*self.page_source('products'))
+    
+    def format_product_row(self, product):
+        """Значения столбцов списка продукции из строки таблицы products"""
+        # id, тип, наименование, артикул, цена, остаток на складе (stock_quantity)
+        return (product[0], product[1], product[2], product[3], product[4], product[18])
     
     def update_stats_data(self):
         """Обновление данных статистики"""
+        self.tasks.submit(
+            "Загрузка статистики",
+            lambda task: (self.db.get_all_partners(), self.db.get_top_products()),
+            self.show_stats_data, key='stats'
+        )
+    
+    def show_stats_data(self, data):
+        """Отображение данных статистики"""
+        partners, top_products = data
         # Обновление списка партнеров для статистики
-        partners = self.db.get_all_partners()
         partner_names = [partner[2] for partner in partners]
         self.stats_partner_combo['values'] = partner_names
         
-        # Обновление топа продуктов
-        for item in self.top_products_tree.get_children():
-            self.top_products_tree.delete(item)
-        
-        top_products = self.db.get_top_products()
-        for product in top_products:
-            self.top_products_tree.insert('', 'end', values=product)
+        # Обновление топа продуктов; строки различаются по названию продукта.
+        # При ошибке чтения (None) остается прежний топ, ошибка уже записана в журнал
+        if top_products is not None:
+            sync_tree(self.top_products_tree, [(product[0], product) for product in top_products])
     
     def update_order_form_data(self):
         """Обновление данных формы заявки"""
-        partners = self.db.get_all_partners()
+        self.tasks.submit(
+            "Загрузка справочников",
+            lambda task: (self.db.get_all_partners(), self.db.get_all_products(), self.db.get_all_employees()),
+            self.show_order_form_data, key='order_form'
+        )
+    
+    def show_order_form_data(self, data):
+        """Заполнение списков формы заявки"""
+        partners, products, employees = data
         partner_names = [partner[2] for partner in partners]
         self.order_partner_combo['values'] = partner_names
         
-        products = self.db.get_all_products()
         product_names = [f"{product[2]} ({product[3]})" for product in products]
         self.order_product_combo['values'] = product_names
         
-        employees = self.db.get_all_employees()
         employee_names = [f"{emp[1]} ({emp[8]})" for emp in employees]
         self.order_manager_combo['values'] = employee_names
     
     def search_partners(self, event=None):
-        """Поиск партнеров"""
-        search_term = self.partner_search_var.get()
-        self.update_partners_list(search_term)
+        """Поиск партнеров по мере ввода: запрос уходит после паузы в наборе"""
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+            self.search_job = None
+        # Клавиши, не меняющие строку поиска (стрелки, Shift), запрос не вызывают
+        if ' '.join(self.partner_search_var.get().split()) == self.partner_search_term:
+            return
+        self.search_job = self.root.after(self.SEARCH_DELAY_MS, self.run_partner_search)
+    
+    def run_partner_search(self):
+        self.search_job = None
+        self.update_partners_list(self.partner_search_var.get())
     
     def on_partner_select(self, event):
         """Обработка выбора партнера"""
         selection = self.partners_tree.selection()
-        if selection:
+        if selection and self.partners_list.is_loaded(selection[0]):
             item = self.partners_tree.item(selection[0])
             partner_data = item['values']
             
@@ -498,11 +1006,12 @@ Email: {partner_data[4]}
 Текущая скидка: {discount * 100:.1f}%
 
 Уровни скидок:
-- Базовый уровень: 2%
-- От 1 млн руб.: 5%
-- От 5 млн руб.: 10%
-- От 10 млн руб.: 15%
 """
+                for threshold, rate in DISCOUNT_TIERS:
+                    if threshold:
+                        stats_text += f"- От {threshold / 1000000:g} млн руб.: {rate * 100:g}%\n"
+                    else:
+                        stats_text += f"- Базовый уровень: {rate * 100:g}%\n"
                 self.stats_text.delete(1.0, tk.END)
                 self.stats_text.insert(1.0, stats_text)
     
@@ -512,22 +1021,23 @@ Email: {partner_data[4]}
         if partner_name:
             partner = self.db.get_partner_by_name(partner_name)
             if partner:
-                stats = self.db.get_partner_sales_statistics(partner[0])
-                discount = self.db.calculate_partner_discount(partner[0])
+                discounts = self.db.get_partner_discounts([partner[0]])
+                info = discounts.get(partner[0]) if discounts else None
+                if not info:
+                    return
                 
                 discount_text = f"""
 Партнер: {partner_name}
-Объем продаж: {stats.get('total_amount', 0):,.2f} руб.
-Текущая скидка: {discount * 100:.1f}%
+Объем продаж: {info['total_amount']:,.2f} руб.
+Текущая скидка: {info['discount'] * 100:.1f}%
 
 Следующий уровень скидки:
 """
-                if discount < 0.15:
-                    next_level = "15%" if discount < 0.10 else "10%" if discount < 0.05 else "5%"
-                    required = 10000000 if discount < 0.10 else 5000000 if discount < 0.05 else 1000000
-                    current = stats.get('total_amount', 0)
-                    remaining = max(0, required - current)
-                    discount_text += f"- Для получения скидки {next_level} необходимо продать еще {remaining:,.2f} руб."
+                if info['next_discount'] is not None:
+                    discount_text += (f"- Для получения скидки {info['next_discount'] * 100:g}% "
+                                      f"необходимо продать еще {info['remaining']:,.2f} руб.")
+                else:
+                    discount_text += "- Достигнут максимальный уровень скидки"
                 
                 self.discount_info_text.delete(1.0, tk.END)
                 self.discount_info_text.insert(1.0, discount_text)
@@ -588,7 +1098,7 @@ Email: {partner_data[4]}
             self.order_quantity_var.set("")
             
             self.log_message(f"Добавлен товар: {name} x {quantity}")
-            
+        
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при добавлении товара: {str(e)}")
     
@@ -659,54 +1169,50 @@ Email: {partner_data[4]}
             total = sum(item['total'] for item in self.current_order_items)
             discount = self.db.calculate_partner_discount(partner[0])
             final_total = total * (1 - discount)
+            # Копия состава: форму можно менять, пока заявка сохраняется
+            items = list(self.current_order_items)
+            delivery_method = self.delivery_method_var.get()
             
-            order_id = self.db.create_order(
-                partner[0],
-                manager_id,
-                self.current_order_items,
-                final_total,
-                self.delivery_method_var.get()
-            )
+            def done(order_id):
+                if order_id:
+                    messagebox.showinfo("Успех", f"Заявка #{order_id} успешно создана!\nСумма: {final_total:,.2f} руб.")
+                    self.clear_order()
+                    self.refresh_tab(self.manage_orders_frame)
+                    self.log_message(f"Создана новая заявка #{order_id} для {partner_name}")
+                else:
+                    messagebox.showerror("Ошибка", "Не удалось создать заявку")
             
-            if order_id:
-                messagebox.showinfo("Успех", f"Заявка #{order_id} успешно создана!\nСумма: {final_total:,.2f} руб.")
-                self.clear_order()
-                self.update_orders_list()
-                self.log_message(f"Создана новая заявка #{order_id} для {partner_name}")
-            else:
-                messagebox.showerror("Ошибка", "Не удалось создать заявку")
-                
+            self.tasks.submit(
+                "Создание заявки",
+                lambda task: self.db.create_order(partner[0], manager_id, items, final_total, delivery_method),
+                done, write=True
+            )
+        
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при создании заявки: {str(e)}")
     
     def update_orders_list(self):
         """Обновление списка заявок"""
-        for item in self.orders_manage_tree.get_children():
-            self.orders_manage_tree.delete(item)
-        
         status_filter = self.filter_status_var.get()
-        if status_filter == "все":
-            orders = self.db.get_all_orders()
-        else:
-            orders = self.db.get_orders_by_status(status_filter)
-        
-        for order in orders:
-            # order structure: [0]id, [1]partner_id, [2]manager_id, [3]order_date, [4]status, 
-            # [5]products_list, [6]total_cost, [7]production_date, [8]prepayment_received,
-            # [9]prepayment_date, [10]prepayment_amount, [11]full_payment_received,
-            # [12]full_payment_date, [13]delivery_method, [14]completion_date, [15]notes,
-            # [16]company_name, [17]manager_name
-            order_id = order[0]
-            order_date = order[3][:10]  # Берем только дату
-            partner_name = order[16] or "Не указан"
-            manager_name = order[17] or "Не указан"
-            total_cost = f"{order[6]:,.2f}" if order[6] else "0.00"
-            status = self.get_status_display_name(order[4])
-            delivery = order[13] or "самовывоз"
-            
-            self.orders_manage_tree.insert('', 'end', values=(
-                order_id, order_date, partner_name, manager_name, total_cost, status, delivery
-            ))
+        status = None if status_filter == "все" else status_filter
+        self.orders_list.set_source(*self.page_source('orders', status))
+    
+    def format_order_row(self, order):
+        """Значения столбцов списка заявок"""
+        # order structure: [0]id, [1]partner_id, [2]manager_id, [3]order_date, [4]status, 
+        # [5]products_list, [6]total_cost, [7]production_date, [8]prepayment_received,
+        # [9]prepayment_date, [10]prepayment_amount, [11]full_payment_received,
+        # [12]full_payment_date, [13]delivery_method, [14]completion_date, [15]notes,
+        # [16]company_name, [17]manager_name
+        order_id = order[0]
+        order_date = order[3][:10]  # Берем только дату
+        partner_name = order[16] or "Не указан"
+        manager_name = order[17] or "Не указан"
+        total_cost = f"{order[6]:,.2f}" if order[6] else "0.00"
+        status = self.get_status_display_name(order[4])
+        delivery = order[13] or "самовывоз"
+        
+        return (order_id, order_date, partner_name, manager_name, total_cost, status, delivery)
     
     def get_status_display_name(self, status):
         """Получение отображаемого имени статуса"""
@@ -727,40 +1233,34 @@ Email: {partner_data[4]}
     def on_order_select(self, event):
         """Обработка выбора заявки"""
         selection = self.orders_manage_tree.selection()
-        if selection:
+        if selection and self.orders_list.is_loaded(selection[0]):
             item = self.orders_manage_tree.item(selection[0])
             order_data = item['values']
             order_id = order_data[0]
             
-            # Получаем полные данные заявки
-            orders = self.db.get_all_orders()
-            selected_order = None
-            for order in orders:
-                if order[0] == order_id:
-                    selected_order = order
-                    break
+            # Получаем полные данные заявки по id
+            selected_order = self.db.get_order(order_id)
             
             if selected_order:
                 details_text = f"""
 ЗАЯВКА #{order_id}
-Дата создания: {selected_order[3]}
-Партнер: {selected_order[16]}
-Менеджер: {selected_order[17]}
-Статус: {self.get_status_display_name(selected_order[4])}
-Способ доставки: {selected_order[13] or 'самовывоз'}
-Общая стоимость: {selected_order[6]:,.2f} руб.
+Дата создания: {selected_order['order_date']}
+Партнер: {selected_order['company_name']}
+Менеджер: {selected_order['manager_name']}
+Статус: {self.get_status_display_name(selected_order['status'])}
+Способ доставки: {selected_order['delivery_method'] or 'самовывоз'}
+Общая стоимость: {selected_order['total_cost']:,.2f} руб.
 
 СОСТАВ ЗАЯВКИ:
 """
-                try:
-                    products_list = json.loads(selected_order[5])
-                    for i, product in enumerate(products_list, 1):
-                        details_text += f"{i}. {product['name']} ({product['article']}) - {product['quantity']} шт. x {product['price']:,.2f} руб. = {product['total']:,.2f} руб.\n"
-                except:
-                    details_text += "Ошибка загрузки состава заявки\n"
+                products_list = selected_order['items']
+                for i, product in enumerate(products_list, 1):
+                    details_text += f"{i}. {product['name']} ({product['article']}) - {product['quantity']} шт. x {product['price']:,.2f} руб. = {product['total']:,.2f} руб.\n"
+                if not products_list:
+                    details_text += "Состав заявки не найден\n"
                 
-                if selected_order[15]:  # notes
-                    details_text += f"\nПримечания: {selected_order[15]}"
+                if selected_order['notes']:
+                    details_text += f"\nПримечания: {selected_order['notes']}"
                 
                 self.order_details_text.delete(1.0, tk.END)
                 self.order_details_text.insert(1.0, details_text)
@@ -768,7 +1268,7 @@ Email: {partner_data[4]}
     def update_selected_order_status(self, new_status):
         """Обновление статуса выбранной заявки"""
         selection = self.orders_manage_tree.selection()
-        if not selection:
+        if not selection or not self.orders_list.is_loaded(selection[0]):
             messagebox.showwarning("Предупреждение", "Выберите заявку для изменения статуса")
             return
         
@@ -787,77 +1287,168 @@ Email: {partner_data[4]}
         status_display = status_names.get(new_status, new_status)
         
         if messagebox.askyesno("Подтверждение", f"Изменить статус заявки #{order_id} на '{status_display}'?"):
-            success = self.db.update_order_status(order_id, new_status)
-            if success:
-                messagebox.showinfo("Успех", f"Статус заявки #{order_id} изменен")
-                self.update_orders_list()
-                self.log_message(f"Статус заявки #{order_id} изменен на '{new_status}'")
-            else:
-                messagebox.showerror("Ошибка", "Не удалось изменить статус заявки")
+            def done(success):
+                if success:
+                    messagebox.showinfo("Успех", f"Статус заявки #{order_id} изменен")
+                    self.update_orders_list()
+                    self.log_message(f"Статус заявки #{order_id} изменен на '{new_status}'")
+                else:
+                    messagebox.showerror("Ошибка", "Не удалось изменить статус заявки")
+            
+            self.tasks.submit(f"Изменение статуса заявки #{order_id}",
+                              lambda task: self.db.update_order_status(order_id, new_status), done, write=True)
     
     def check_expired_orders(self):
         """Проверка просроченных заявок"""
-        expired_count = self.db.check_expired_orders()
-        if expired_count > 0:
-            messagebox.showinfo("Информация", f"Автоматически отменено {expired_count} заявок с истекшим сроком предоплаты")
-            self.update_orders_list()
+        def done(expired_count):
+            if expired_count is None:
+                messagebox.showerror("Ошибка", "Не удалось проверить просроченные заявки")
+            elif expired_count > 0:
+                messagebox.showinfo("Информация", f"Автоматически отменено {expired_count} заявок с истекшим сроком предоплаты")
+                self.refresh_tab(self.manage_orders_frame)
+            else:
+                messagebox.showinfo("Информация", "Просроченных заявок не найдено")
+        
+        self.tasks.submit("Проверка просроченных заявок", lambda task: self.db.check_expired_orders(), done,
+                          write=True)
+    
+    def toggle_expiry_scheduler(self):
+        """Включение и выключение фоновой проверки просроченных заявок"""
+        if self.auto_expiry_var.get():
+            self.db.start_expiry_scheduler(on_expired=self.expired_queue.put)
+            if self.expiry_poll_job is None:
+                self.poll_expired_orders()
         else:
-            messagebox.showinfo("Информация", "Просроченных заявок не найдено")
+            # Остановка без ожидания потока, чтобы не задерживать интерфейс
+            self.db.stop_expiry_scheduler(timeout=0)
+            if self.expiry_poll_job is not None:
+                self.root.after_cancel(self.expiry_poll_job)
+                self.expiry_poll_job = None
     
-    def import_data(self, data_type):
-        """Импорт данных определенного типа"""
-        file_map = {
+    def poll_expired_orders(self):
+        """Обработка результатов фоновой проверки в главном потоке Tk"""
+        expired_ids = []
+        while not self.expired_queue.empty():
+            expired_ids.extend(self.expired_queue.get_nowait())
+        if expired_ids:
+            self.refresh_tab(self.manage_orders_frame)
+            self.status_var.set(f"Автоматически отменено {len(expired_ids)} заявок с истекшим сроком предоплаты")
+            self.log_message(f"Автоматически отменены заявки: {', '.join(map(str, expired_ids))}")
+        self.expiry_poll_job = self.root.after(1000, self.poll_expired_orders)
+    
+    def get_import_sources(self):
+        """Файлы импорта: тип данных -> (файл, метод импорта, описание)"""
+        return {
             'material_types': ('Material_type_import.xlsx', self.db.import_material_types, "типов материалов"),
             'product_types': ('Product_type_import.xlsx', self.db.import_product_types, "типов продукции"),
             'products': ('Products_import.xlsx', self.db.import_products, "продукции"),
             'partners': ('Partners_import.xlsx', self.db.import_partners, "партнеров"),
-            'sales': ('Partner_products_import.xlsx', self.db.import_sales_history, "истории продаж")
+            'sales_history': ('Partner_products_import.xlsx', self.db.import_sales_history, "истории продаж")
         }
-        
-        if data_type in file_map:
-            filename, import_func, description = file_map[data_type]
+    
+    def run_imports(self, task, data_types):
+        """Последовательный импорт в рабочем потоке: список (описание, успех, ошибка)"""
+        results = []
+        for data_type in data_types:
+            filename, import_func, description = self.get_import_sources()[data_type]
+            if task.cancel_event.is_set():
+                break
+            
+            def progress(rows, description=description):
+                self.tasks.report(task, f"{description} - прочитано {rows:,} строк")
+            
             try:
-                success = import_func(filename)
-                if success:
-                    self.log_message(f"✅ Успешно импортированы данные {description}")
-                    # Обновление интерфейса
-                    self.update_partners_list()
-                    self.update_products_list()
-                    self.update_stats_data()
-                    self.update_order_form_data()
-                    self.update_orders_list()
-                else:
-                    self.log_message(f"❌ Ошибка импорта {description}")
+                success = import_func(filename, cancel_event=task.cancel_event, progress=progress)
+                results.append((description, success, None))
             except Exception as e:
-                self.log_message(f"❌ Ошибка при импорте {description}: {str(e)}")
+                results.append((description, False, e))
+        return results
+    
+    def show_import_results(self, results, task):
+        """Вывод результатов импорта в лог и обновление интерфейса"""
+        for description, success, error in results:
+            if error is not None:
+                self.log_message(f"❌ Ошибка при импорте {description}: {str(error)}")
+            elif success:
+                self.log_message(f"✅ Успешно импортированы данные {description}")
+            elif task.cancel_event.is_set():
+                self.log_message(f"⛔ Импорт {description} отменен")
+            else:
+                self.log_message(f"❌ Ошибка импорта {description}")
+        
+        # Обновление интерфейса один раз после всех файлов
+        if any(success for _, success, _ in results):
+            self.refresh_all_views()
+    
+    def refresh_all_views(self):
+        """Обновление всех загруженных вкладок после изменения данных"""
+        for tab in self.loaded_tabs:
+            self.tab_loaders[tab]()
+    
+    def import_data(self, data_type):
+        """Импорт данных определенного типа"""
+        if data_type not in self.get_import_sources():
+            return
+        description = self.get_import_sources()[data_type][2]
+        task = self.tasks.submit(
+            f"Импорт {description}",
+            lambda task: self.run_imports(task, [data_type]),
+            lambda results: self.show_import_results(results, task),
+            cancellable=True, write=True
+        )
     
     def import_all_data(self):
         """Импорт всех данных"""
         self.log_message("Начало импорта всех данных...")
+        sources = self.get_import_sources()
         
-        import_types = ['material_types', 'product_types', 'products', 'partners', 'sales']
-        
-        for data_type in import_types:
-            self.import_data(data_type)
+        def run(task):
+            def progress(kind, rows):
+                self.tasks.report(task, f"{sources[kind][2]} - прочитано {rows:,} строк")
+            
+            # Файлы загружаются с учетом зависимостей, каждый своей транзакцией
+            results = self.db.import_files({kind: source[0] for kind, source in sources.items()},
+                                           cancel_event=task.cancel_event, progress=progress)
+            return [(sources[kind][2], error is None, error) for kind, rows, error in results]
+        
+        def done(results):
+            self.show_import_results(results, task)
+            failures = [f"{description}: {error}" for description, success, error in results if not success]
+            if task.cancel_event.is_set():
+                self.log_message("Импорт всех данных прерван")
+                messagebox.showwarning("Импорт", "Импорт данных отменен, загруженные до отмены файлы сохранены")
+            elif failures:
+                self.log_message("Импорт всех данных завершен с ошибками")
+                messagebox.showwarning("Импорт", "Не загружены данные:\n" + '\n'.join(failures))
+            else:
+                self.log_message("Импорт всех данных завершен!")
+                messagebox.showinfo("Импорт", "Импорт всех данных завершен успешно!")
         
-        self.log_message("Импорт всех данных завершен!")
-        messagebox.showinfo("Импорт", "Импорт всех данных завершен успешно!")
+        task = self.tasks.submit("Импорт всех данных", run, done, cancellable=True, write=True)
     
     def log_message(self, message):
         """Добавление сообщения в лог"""
-        self.import_log.insert(tk.END, f"{message}\n")
-        self.import_log.see(tk.END)
-        self.root.update()
+        self.log_sink.write(message)
     
     def import_initial_data(self):
         """Импорт начальных данных"""
         self.log_message("Запуск системы...")
         self.log_message("Инициализация базы данных завершена")
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Мастер пол: учет партнеров и заявок")
+    add_stats_arguments(parser)
+    stats = start_stats(parser.parse_args(argv))
+    
     root = tk.Tk()
-    app = MasterPolGUI(root)
+    app = MasterPolGUI(root, Database(stats=stats))
     root.mainloop()
+    app.tasks.shutdown()
+    logging.getLogger('database').removeHandler(app.log_sink)
+    app.log_sink.close()
+    app.db.close()
+    if stats is not None:
+        stats.stop_dump()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
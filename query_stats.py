@@ -0,0 +1,303 @@
+import sqlite3
+import functools
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+
+
+class LatencyHistogram:
+    """Гистограмма задержек по фиксированным границам (мс)"""
+    BOUNDS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+    
+    def add(self, elapsed_ms):
+        self.counts[bisect_left(self.BOUNDS_MS, elapsed_ms)] += 1
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+    
+    def snapshot(self):
+        labels = [f'<={bound}ms' for bound in self.BOUNDS_MS] + [f'>{self.BOUNDS_MS[-1]}ms']
+        return {
+            'calls': self.calls,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'histogram': {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+class QueryStats:
+    """Счетчики вызовов методов Database и SQL-запросов, журнал медленных запросов"""
+    # Методы Database, которые не оборачиваются: служебные и контекстные менеджеры
+    SKIP_METHODS = frozenset({
+        'get_connection', 'open_connection', 'release_connection', 'setup_logging', 'log_error',
+        'transaction', 'close',
+    })
+    MAX_SLOW_QUERIES = 100
+    
+    def __init__(self, slow_query_ms=100):
+        self.slow_query_ms = slow_query_ms
+        self.lock = threading.Lock()
+        self.methods = {}
+        self.statements = {}
+        self.slow = deque(maxlen=self.MAX_SLOW_QUERIES)
+        # Стек выполняемых оберток методов в каждом потоке: для учета перехваченных ошибок
+        self.local = threading.local()
+        self.dump_thread = None
+        self.dump_stop = None
+        self.dump_path = None
+        self.logger = logging.getLogger(__name__)
+    
+    def wrap_methods(self, db):
+        """Замена публичных методов объекта Database обертками с замером времени"""
+        for name in dir(type(db)):
+            if name.startswith('_') or name in self.SKIP_METHODS:
+                continue
+            if not callable(getattr(type(db), name)):
+                continue
+            setattr(db, name, self.timed(name, getattr(db, name)))
+    
+    def timed(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            calls = self.local.__dict__.setdefault('calls', [])
+            calls.append(name)
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = method(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                calls.pop()
+                self.record_call(name, (time.perf_counter() - started) * 1000, failed)
+        return wrapper
+    
+    def method_entry(self, name):
+        # Вызывается под self.lock
+        entry = self.methods.get(name)
+        if entry is None:
+            entry = self.methods[name] = {'latency': LatencyHistogram(), 'errors': 0}
+        return entry
+    
+    def record_call(self, name, elapsed_ms, failed=False):
+        with self.lock:
+            entry = self.method_entry(name)
+            entry['latency'].add(elapsed_ms)
+            if failed:
+                entry['errors'] += 1
+    
+    def record_error(self, name=None):
+        """Учет ошибки, перехваченной внутри метода (по умолчанию - выполняемого в этом потоке)"""
+        if name is None:
+            calls = getattr(self.local, 'calls', None)
+            if not calls:
+                return
+            name = calls[-1]
+        with self.lock:
+            self.method_entry(name)['errors'] += 1
+    
+    def statement_entry(self, sql):
+        # Вызывается под self.lock
+        entry = self.statements.get(sql)
+        if entry is None:
+            entry = self.statements[sql] = {
+                'latency': LatencyHistogram(), 'rows': 0, 'blob_bytes': 0, 'fetch_ms': 0.0,
+            }
+        return entry
+    
+    def record_statement(self, sql, elapsed_ms, plan=None):
+        """Учет выполнения запроса; plan - функция получения EXPLAIN QUERY PLAN для медленных"""
+        with self.lock:
+            self.statement_entry(sql)['latency'].add(elapsed_ms)
+        if elapsed_ms < self.slow_query_ms:
+            return
+        details = []
+        if plan is not None:
+            try:
+                details = plan()
+            except sqlite3.Error:
+                pass
+        with self.lock:
+            self.slow.append({
+                'sql': sql,
+                'ms': round(elapsed_ms, 3),
+                'plan': details,
+                'at': datetime.now().isoformat(timespec='seconds'),
+            })
+        self.logger.warning(f"Медленный запрос ({elapsed_ms:.1f} мс): {sql}"
+                            + (f" | план: {'; '.join(details)}" if details else ""))
+    
+    def record_fetch(self, sql, rows, blob_bytes, elapsed_ms):
+        with self.lock:
+            entry = self.statement_entry(sql)
+            entry['rows'] += rows
+            entry['blob_bytes'] += blob_bytes
+            entry['fetch_ms'] += elapsed_ms
+    
+    def snapshot(self):
+        """Текущие показатели: методы, запросы и последние медленные запросы"""
+        with self.lock:
+            return {
+                'taken_at': datetime.now().isoformat(timespec='seconds'),
+                'slow_query_ms': self.slow_query_ms,
+                'methods': {
+                    name: dict(entry['latency'].snapshot(), errors=entry['errors'])
+                    for name, entry in self.methods.items()
+                },
+                'statements': {
+                    sql: dict(entry['latency'].snapshot(), rows=entry['rows'],
+                              blob_bytes=entry['blob_bytes'], fetch_ms=round(entry['fetch_ms'], 3))
+                    for sql, entry in self.statements.items()
+                },
+                'slow': list(self.slow),
+            }
+    
+    def reset(self):
+        with self.lock:
+            self.methods.clear()
+            self.statements.clear()
+            self.slow.clear()
+    
+    def dump(self, path):
+        """Запись снимка показателей в JSON файл"""
+        snapshot = self.snapshot()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        return snapshot
+    
+    def start_dump(self, path, interval=60):
+        """Периодическая запись снимка показателей в файл (период в секундах)"""
+        if self.dump_thread is not None:
+            return False
+        self.dump_path = path
+        stop = self.dump_stop = threading.Event()
+        
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    self.logger.error(f"Ошибка записи показателей запросов: {e}")
+        
+        self.dump_thread = threading.Thread(target=run, name='query-stats-dump', daemon=True)
+        self.dump_thread.start()
+        return True
+    
+    def stop_dump(self, timeout=5):
+        """Остановка периодической записи; последний снимок записывается сразу"""
+        if self.dump_thread is None:
+            return
+        self.dump_stop.set()
+        self.dump_thread.join(timeout)
+        self.dump_thread = None
+        try:
+            self.dump(self.dump_path)
+        except OSError as e:
+            self.logger.error(f"Ошибка записи показателей запросов: {e}")
+
+
+def add_stats_arguments(parser):
+    """Параметры командной строки для включения QueryStats"""
+    group = parser.add_argument_group("статистика запросов")
+    group.add_argument('--stats-dump', metavar='PATH',
+                       help="включить статистику и периодически записывать ее в файл JSON")
+    group.add_argument('--stats-interval', type=float, default=60, help="период записи статистики, с")
+    group.add_argument('--slow-query-ms', type=float, default=100, help="порог медленного запроса, мс")
+
+
+def start_stats(args):
+    """QueryStats с периодической записью по параметрам add_stats_arguments() или None"""
+    if not args.stats_dump:
+        return None
+    stats = QueryStats(args.slow_query_ms)
+    stats.start_dump(args.stats_dump, args.stats_interval)
+    return stats
+
+
+def normalize_sql(sql):
+    """Текст запроса в одну строку: одинаковые запросы учитываются вместе"""
+    return ' '.join(sql.split())
+
+
+def blob_size(rows):
+    return sum(len(value) for row in rows for value in row if isinstance(value, (bytes, memoryview)))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, сообщающий QueryStats время запросов, число строк и объем BLOB"""
+    
+    def execute(self, sql, parameters=()):
+        self.sql = normalize_sql(sql)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.stats.record_statement(
+                self.sql, (time.perf_counter() - started) * 1000,
+                lambda: self.connection.explain(sql, parameters)
+            )
+    
+    def executemany(self, sql, seq_of_parameters):
+        self.sql = normalize_sql(sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.stats.record_statement(self.sql, (time.perf_counter() - started) * 1000)
+    
+    def fetched(self, rows, started):
+        if getattr(self, 'sql', None) is not None:
+            self.connection.stats.record_fetch(self.sql, len(rows), blob_size(rows),
+                                               (time.perf_counter() - started) * 1000)
+        return rows
+    
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self.fetched([row] if row is not None else [], started)
+        return row
+    
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        return self.fetched(super().fetchmany(self.arraysize if size is None else size), started)
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        return self.fetched(super().fetchall(), started)
+    
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        self.fetched([row], started)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, все курсоры которого учитываются в QueryStats (атрибут stats)"""
+    stats = None
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def explain(self, sql, parameters=()):
+        """Строки EXPLAIN QUERY PLAN без учета в статистике"""
+        cursor = super().cursor()
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)
+        return [row[3] for row in cursor.fetchall()]